@@ -4,16 +4,50 @@
 import sys
 import os
 import json
+import hashlib
+import time
+import asyncio
+import threading
+import random
+import heapq
+import sqlite3
+import mimetypes
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import babel.dates
+from functools import lru_cache, partial
+from itertools import groupby
+from types import SimpleNamespace
+from flask import Flask, Blueprint, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context, session, make_response, g, has_request_context, send_from_directory
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool, QueuePool
+from werkzeug.http import is_resource_modified
 import logging
+import click
+from datetime import timedelta
 from logging import Formatter, FileHandler
 from flask_wtf import Form
+try:
+  import orjson
+except ImportError:  # the JSON API falls back to the standard library encoder
+  orjson = None
 from forms import *
+from search import SearchIndex
+from pagination import KeysetPage, decode_cursor
+from cache import PageCache
+from fragments import FragmentCache, FragmentCacheExtension
+from bulk_import import BulkImporter, read_rows
+from metrics import registry, InstrumentedQueuePool
+from profiling import StatementRecorder
+from replicas import ReplicaSet, RoutingSQLAlchemy
+import geo
+from assets import AssetManifest, build as build_assets
+from compression import CompressionMiddleware
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,10 +55,41 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+
+def engine_options(config, uri):
+  """Builds the options of the engine for uri from the DB_POOL_* settings."""
+  url = make_url(uri)
+  options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+  if url.get_backend_name() != 'sqlite':
+    options.update(
+      poolclass=InstrumentedQueuePool,
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'],
+      pool_recycle=config['DB_POOL_RECYCLE'],
+    )
+  if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT']:
+    options['connect_args'] = {'options': '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT'])}
+  return options
+
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI']))
+db = RoutingSQLAlchemy(app)
+db.replicas = ReplicaSet(
+  [create_engine(url, **engine_options(app.config, url)) for url in app.config['REPLICA_DATABASE_URLS']],
+  max_lag=app.config['REPLICA_MAX_LAG_SECONDS'],
+  check_interval=app.config['REPLICA_CHECK_INTERVAL']
+)
 
 migrate = Migrate(app, db)
 
+@db.event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite leaves foreign keys, and so ON DELETE CASCADE, off by default
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 # TODO: connect to a local postgresql database
 
 #----------------------------------------------------------------------------#
@@ -33,6 +98,10 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        db.Index('ix_Venue_geohash', 'geohash'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
@@ -46,7 +115,22 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='venue', lazy=False, cascade="all, delete-orphan")
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # nearby searches are index range scans over geohash prefixes
+    geohash = db.Column(db.String(12))
+    # set when the venue is deleted; it is hidden from then on and removed
+    # with its shows by purge_venue
+    archived_at = db.Column(db.DateTime)
+    # shows go with their venue or artist through ON DELETE CASCADE
+    shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Venue ID: {self.id}, name: {self.name}>'
@@ -67,98 +151,465 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String())
-    shows = db.relationship('Show', backref='artist', lazy=False, cascade="all, delete-orphan")
+    shows = db.relationship('Show', backref='artist', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Artist ID: {self.id}, name: {self.name}>'
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre ID: {self.id}, name: {self.name}>'
+
+# Venue.genres and Artist.genres keep the comma separated names for display;
+# these tables index the same genres for filtering and facet counts.
+
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time', 'start_time'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
   start_time = db.Column(db.DateTime, nullable = False, default=datetime.utcnow())
+  # On PostgreSQL the migrations also add exclusion constraints rejecting
+  # overlapping (start_time, end_time) ranges per venue and per artist.
+  end_time = db.Column(db.DateTime, nullable=False)
+  version = db.Column(db.Integer, nullable=False, default=1)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+  __mapper_args__ = {'version_id_col': version}
 
   def __repr__(self):
         return f'<Show ID: {self.id}, Venue ID: {self.venue_id}, Artist ID: {self.artist_id}, Start Time: {self.start_time}>'
 
+def unarchived(model):
+  # criteria hiding archived venues; artists are never archived
+  return (Venue.archived_at.is_(None),) if model is Venue else ()
+
+class BookingError(ValueError):
+  """A show refers to an unknown venue or artist, or overlaps another show."""
+
+def find_booking_conflict(connection, venue_id, artist_id, start_time, end_time, show_id=None):
+  # Returns a message naming the first show overlapping start_time..end_time
+  # at the venue or with the artist, or None. Shows last at most
+  # MAX_SHOW_DURATION, so only those starting in that window before
+  # start_time can overlap: a bounded range scan of the (venue_id,
+  # start_time) and (artist_id, start_time) indexes however many shows
+  # came before.
+  earliest = start_time - timedelta(minutes=MAX_SHOW_DURATION)
+  for column, value, party in ((Show.venue_id, venue_id, 'the venue'), (Show.artist_id, artist_id, 'the artist')):
+    query = db.select(Show.id, Show.start_time, Show.end_time,
+                      Venue.name.label('venue_name'), Artist.name.label('artist_name')) \
+      .join(Venue, Show.venue_id == Venue.id) \
+      .join(Artist, Show.artist_id == Artist.id) \
+      .where(column == value, Show.start_time > earliest, Show.start_time < end_time, Show.end_time > start_time) \
+      .order_by(Show.start_time) \
+      .limit(1)
+    if show_id is not None:
+      query = query.where(Show.id != show_id)
+    conflict = connection.execute(query).first()
+    if conflict is not None:
+      return '{} is already booked: show {} ({} at {}, {} to {})'.format(
+        party, conflict.id, conflict.artist_name, conflict.venue_name, conflict.start_time, conflict.end_time)
+  return None
+
+@db.event.listens_for(Show, 'before_insert')
+@db.event.listens_for(Show, 'before_update')
+def check_booking(mapper, connection, show):
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    if connection.execute(db.select(model.id).where(model.id == entity_id, *unarchived(model))).first() is None:
+      raise BookingError('unknown {} {}'.format(model.__tablename__.lower(), entity_id))
+  if show.end_time <= show.start_time:
+    raise BookingError('a show must end after it starts')
+  conflict = find_booking_conflict(connection, show.venue_id, show.artist_id,
+                                   show.start_time, show.end_time, show_id=show.id) or \
+    find_pending_conflict(db.inspect(show).session, show)
+  if conflict is not None:
+    raise BookingError(conflict)
+
+def find_pending_conflict(session, show):
+  # The shows of one flush are all checked before any of them is written, so
+  # they are also checked against each other here; there is no exclusion
+  # constraint to catch them outside PostgreSQL.
+  for other in list(session.new) + list(session.dirty):
+    if other is show or not isinstance(other, Show) or other.start_time is None or other.end_time is None:
+      continue
+    if other.start_time < show.end_time and show.start_time < other.end_time:
+      for party, same in (('the venue', other.venue_id == show.venue_id), ('the artist', other.artist_id == show.artist_id)):
+        if same:
+          return '{} is already booked: a show saved with this one ({} to {})'.format(
+            party, other.start_time, other.end_time)
+  return None
+
+# Venue and artist pages list their shows and each other's names, so a change
+# to one of those rows also moves updated_at of the pages that display it.
+
+@db.event.listens_for(Show, 'after_insert')
+@db.event.listens_for(Show, 'after_update')
+@db.event.listens_for(Show, 'after_delete')
+def touch_show_pages(mapper, connection, show):
+  now = datetime.utcnow()
+  connection.execute(Venue.__table__.update().where(Venue.id == show.venue_id).values(updated_at=now))
+  connection.execute(Artist.__table__.update().where(Artist.id == show.artist_id).values(updated_at=now))
+
+# upcoming_shows_count, past_shows_count and next_show_time of venues and
+# artists follow show inserts and deletes here; "flask advance-shows" moves
+# shows that have started from upcoming to past.
+
+def refresh_show_counters(connection, model, show_column, criterion):
+  # recomputes the counters of the venues or artists matching criterion
+  now = datetime.now()
+  table = model.__table__
+  upcoming = db.select(db.func.count(Show.id)) \
+    .where(show_column == table.c.id, Show.start_time > now).scalar_subquery()
+  past = db.select(db.func.count(Show.id)) \
+    .where(show_column == table.c.id, Show.start_time <= now).scalar_subquery()
+  next_show_time = db.select(db.func.min(Show.start_time)) \
+    .where(show_column == table.c.id, Show.start_time > now).scalar_subquery()
+  result = connection.execute(table.update().where(criterion).values(
+    upcoming_shows_count=upcoming,
+    past_shows_count=past,
+    next_show_time=next_show_time
+  ))
+  return result.rowcount
+
+@db.event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  for table, entity_id in ((Venue.__table__, show.venue_id), (Artist.__table__, show.artist_id)):
+    if show.start_time > datetime.now():
+      values = {
+        "upcoming_shows_count": table.c.upcoming_shows_count + 1,
+        "next_show_time": db.case(
+          (db.or_(table.c.next_show_time.is_(None), table.c.next_show_time > show.start_time), show.start_time),
+          else_=table.c.next_show_time
+        )
+      }
+    else:
+      values = {"past_shows_count": table.c.past_shows_count + 1}
+    connection.execute(table.update().where(table.c.id == entity_id).values(**values))
+
+@db.event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  now = datetime.now()
+  for table, show_column, entity_id in ((Venue.__table__, Show.venue_id, show.venue_id),
+                                        (Artist.__table__, Show.artist_id, show.artist_id)):
+    if show.start_time > now:
+      next_show_time = db.select(db.func.min(Show.start_time)) \
+        .where(show_column == entity_id, Show.start_time > now).scalar_subquery()
+      values = {
+        "upcoming_shows_count": table.c.upcoming_shows_count - 1,
+        "next_show_time": next_show_time
+      }
+    else:
+      values = {"past_shows_count": table.c.past_shows_count - 1}
+    connection.execute(table.update().where(table.c.id == entity_id).values(**values))
+
+@db.event.listens_for(Show, 'after_update')
+def recount_updated_show(mapper, connection, show):
+  # a show moved to another time, venue or artist: recount every row involved
+  venue_ids = {show.venue_id} | set(db.inspect(show).attrs.venue_id.history.deleted)
+  artist_ids = {show.artist_id} | set(db.inspect(show).attrs.artist_id.history.deleted)
+  refresh_show_counters(connection, Venue, Show.venue_id, Venue.id.in_(venue_ids))
+  refresh_show_counters(connection, Artist, Show.artist_id, Artist.id.in_(artist_ids))
+
+def touch_linked_pages(connection, model, entity_id, limit=None, before=None):
+  # Moves updated_at of the artists playing at a venue, or of the venues an
+  # artist plays at. With limit, only of that many, those with the latest
+  # shows first, and with before, only of those not touched since; returns
+  # how many were touched.
+  if model is Venue:
+    other, other_column, show_column = Artist, Show.artist_id, Show.venue_id
+  else:
+    other, other_column, show_column = Venue, Show.venue_id, Show.artist_id
+  ids = db.select(other_column).where(show_column == entity_id)
+  if before is not None:
+    ids = ids.join(other, other.id == other_column).where(other.updated_at < before)
+  if limit is None:
+    ids = ids.distinct()
+  else:
+    ids = ids.group_by(other_column).order_by(db.func.max(Show.start_time).desc()).limit(limit)
+  ids = [row[0] for row in connection.execute(ids)]
+  if ids:
+    connection.execute(other.__table__.update().where(other.id.in_(ids)).values(updated_at=datetime.utcnow()))
+  return len(ids)
+
+@db.event.listens_for(Venue, 'after_update')
+def touch_venue_artists(mapper, connection, venue):
+  touch_linked_pages(connection, Venue, venue.id)
+
+@db.event.listens_for(Artist, 'after_update')
+def touch_artist_venues(mapper, connection, artist):
+  touch_linked_pages(connection, Artist, artist.id)
+
+# Venues are placed on the map from their address when it is entered or
+# changed; "flask geocode-venues" places the ones added before.
+
+geocoder = geo.geocoder_from_config(app.config)
+
+def venue_geohash(latitude, longitude):
+  if latitude is None or longitude is None:
+    return None
+  return geo.encode(latitude, longitude, app.config['GEOHASH_PRECISION'])
+
+@db.event.listens_for(Venue, 'before_insert')
+@db.event.listens_for(Venue, 'before_update')
+def locate_venue(mapper, connection, venue):
+  attrs = db.inspect(venue).attrs
+  moved = any(attrs[name].history.has_changes() for name in ('address', 'city', 'state'))
+  placed = attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+  if moved and not placed:
+    venue.latitude, venue.longitude = geocoder.geocode(venue.address, venue.city, venue.state) or (None, None)
+  venue.geohash = venue_geohash(venue.latitude, venue.longitude)
+
+def genre_links(model):
+  # the link table of venues or artists and the name of its id column
+  return (venue_genres, 'venue_id') if model is Venue else (artist_genres, 'artist_id')
+
+def genre_names(genres):
+  return [name for name in (genres or '').split(',') if name]
+
+def sync_genres(connection, model, criterion):
+  # rewrites the genre links of the venues or artists matching criterion
+  # from their genres column, creating missing Genre rows on the way
+  link, key = genre_links(model)
+  rows = connection.execute(db.select(model.id, model.genres).where(criterion)).fetchall()
+  if not rows:
+    return
+  names = {name for row in rows for name in genre_names(row.genres)}
+  genre_ids = dict(connection.execute(db.select(Genre.name, Genre.id).where(Genre.name.in_(names))).fetchall())
+  missing = names - set(genre_ids)
+  if missing:
+    connection.execute(Genre.__table__.insert(), [{"name": name} for name in missing])
+    genre_ids.update(connection.execute(db.select(Genre.name, Genre.id).where(Genre.name.in_(missing))).fetchall())
+  connection.execute(link.delete().where(link.c[key].in_([row.id for row in rows])))
+  links = [{key: row.id, "genre_id": genre_ids[name]} for row in rows for name in set(genre_names(row.genres))]
+  if links:
+    connection.execute(link.insert(), links)
+
+@db.event.listens_for(Venue, 'after_insert')
+@db.event.listens_for(Venue, 'after_update')
+@db.event.listens_for(Artist, 'after_insert')
+@db.event.listens_for(Artist, 'after_update')
+def sync_entity_genres(mapper, connection, entity):
+  if db.inspect(entity).attrs.genres.history.has_changes():
+    model = mapper.class_
+    sync_genres(connection, model, model.id == entity.id)
+
+@db.event.listens_for(Venue, 'after_delete')
+@db.event.listens_for(Artist, 'after_delete')
+def delete_entity_genres(mapper, connection, entity):
+  # the link tables cascade, but only on SQLite connections opened with
+  # foreign keys on
+  link, key = genre_links(mapper.class_)
+  connection.execute(link.delete().where(link.c[key] == entity.id))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # compiled Babel pattern and parsed locale, built once per (format, locale)
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=app.config['DATETIME_FILTER_CACHE_SIZE'])
+def format_datetime(value, format='medium', locale='en'):
+  # value is a datetime or a string such as str(show.start_time); the same
+  # show times come back on every page, so results are memoized
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  if date.tzinfo is None:
+    # babel.dates.format_datetime treats naive datetimes as UTC as well
+    date = date.replace(tzinfo=babel.dates.UTC)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(date, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
-# Controllers.
+# Assets.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
-def index():
-  return render_template('pages/home.html')
+# "flask build-assets" writes fingerprinted, precompressed copies of static/
+# to ASSETS_DIR. Their names change with their content, so they are cached
+# for good and a repeat visit requests none of them.
+
+asset_manifest = AssetManifest(app.config['ASSETS_DIR'])
+
+@app.template_global()
+def asset_url(path):
+  # the URL of static/<path>, fingerprinted once the assets are built
+  name = asset_manifest.get(path)
+  if name is None:
+    return url_for('static', filename=path)
+  return url_for('asset', filename=name)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+  if filename not in asset_manifest.files:
+    abort(404)
+  path, encoding = asset_manifest.choose(filename, request.accept_encodings)
+  response = send_from_directory(app.config['ASSETS_DIR'], path,
+                                 mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                                 max_age=app.config['ASSETS_MAX_AGE'])
+  if encoding is not None:
+    response.content_encoding = encoding
+  response.vary.add('Accept-Encoding')
+  response.cache_control.public = True
+  response.cache_control.immutable = True
+  return response
 
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
 
-#  Venues
-#  ----------------------------------------------------------------
+venue_index = SearchIndex()
+artist_index = SearchIndex()
+search_rebuild_lock = threading.Lock()
+
+# the searches only match names
+def venue_document(venue):
+  return {"name": venue.name}
+
+def artist_document(artist):
+  return {"name": artist.name}
+
+@app.before_first_request
+def build_search_indexes():
+  venue_index.rebuild(
+    (venue.id, venue_document(venue))
+    for venue in db.session.query(Venue.id, Venue.name).filter(*unarchived(Venue))
+  )
+  artist_index.rebuild(
+    (artist.id, artist_document(artist))
+    for artist in db.session.query(Artist.id, Artist.name)
+  )
+
+def refresh_search_indexes():
+  # writes handled by other worker processes never reach this process's
+  # indexes, so they are rebuilt once they are older than SEARCH_INDEX_MAX_AGE,
+  # by a background thread while the searches keep using the current ones
+  built_at = venue_index.built_at
+  if built_at is None:
+    build_search_indexes()
+  elif time.time() - built_at > app.config['SEARCH_INDEX_MAX_AGE'] and search_rebuild_lock.acquire(blocking=False):
+    def run():
+      with app.app_context():
+        try:
+          build_search_indexes()
+        except Exception:
+          app.logger.exception('rebuilding the search indexes failed')
+        finally:
+          search_rebuild_lock.release()
+    threading.Thread(target=run, name='search-rebuild', daemon=True).start()
+
+def upcoming_shows_query(model, ids):
+  return db.session.query(model.id, model.upcoming_shows_count).filter(model.id.in_(ids))
+
+def count_upcoming_shows(model, ids):
+  # maps each of ids to the upcoming show counter of that venue or artist
+  if not ids:
+    return {}
+  return dict(upcoming_shows_query(model, ids).all())
+
+def search_results(index, ids, upcoming_shows):
+  return {
+    "count": len(ids),
+    "data": [{
+      "id": entity_id,
+      "name": index[entity_id]["name"],
+      "num_upcoming_shows": upcoming_shows.get(entity_id, 0)
+    } for entity_id in ids]
+  }
 
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  locations = Venue.query.distinct(Venue.city, Venue.state).all()
-  data = []
-  for location in locations:
-    venues = Venue.query.filter_by(city=location.city, state=location.state).all()
-    obj = {
-      "city": location.city,
-      "state": location.state,
-    }
-    location_venues = []
-    for venue in venues:
-      location_venues.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
-      })
-    obj["venues"] = location_venues
-    data.append(obj)
-  return render_template('pages/venues.html', areas=data)
+def nearby_venues(latitude, longitude, radius_km, limit):
+  # The nearest venues within radius_km. The search starts half a kilometre
+  # around the point and widens fourfold until it holds limit venues, so a
+  # dense city is answered from a few hundred rows and an empty region from
+  # a few index range scans.
+  columns = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+             Venue.upcoming_shows_count)
+  reach = min(radius_km, 0.5)
+  while True:
+    ranges = geo.covering_ranges(latitude, longitude, reach, finest=app.config['GEOHASH_PRECISION'])
+    criteria = [Venue.geohash >= low if high is None else db.and_(Venue.geohash >= low, Venue.geohash < high)
+                for low, high in ranges]
+    found = []
+    for venue in db.session.query(*columns).filter(db.or_(*criteria), *unarchived(Venue)):
+      distance = geo.distance_km(latitude, longitude, venue.latitude, venue.longitude)
+      if distance <= reach:
+        found.append((distance, venue))
+    if len(found) >= limit or reach >= radius_km:
+      break
+    reach = min(radius_km, reach * 4)
+  return [{
+    "id": venue.id,
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "distance_km": distance,
+    "num_upcoming_shows": venue.upcoming_shows_count
+  } for distance, venue in heapq.nsmallest(limit, found, key=lambda pair: pair[0])]
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  venues = Venue.query.filter(Venue.name.ilike('%{}%'.format(request.form['search_term']))).all()
-  response={
-    "count": len(venues),
-    "data": []
-    }
-  for venue in venues:
-    response["data"].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
-    })
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+#----------------------------------------------------------------------------#
+# Page data.
+#----------------------------------------------------------------------------#
 
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
+page_cache = PageCache.from_config(app.config)
+
+# Rendered fragments of the listings, cached by {% cache %} in the templates.
+# Their keys hold the versions of the entities they show, and the fragments
+# of an entity are dropped as soon as it changes or goes away.
+fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_MAX_BYTES'])
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = fragment_cache
+
+@db.event.listens_for(Venue, 'after_update')
+@db.event.listens_for(Venue, 'after_delete')
+@db.event.listens_for(Artist, 'after_update')
+@db.event.listens_for(Artist, 'after_delete')
+@db.event.listens_for(Show, 'after_update')
+@db.event.listens_for(Show, 'after_delete')
+def drop_fragments(mapper, connection, entity):
+  fragment_cache.invalidate('{}:{}'.format(mapper.class_.__tablename__.lower(), entity.id))
+
+def build_venue_data(venue):
   past_shows = list(filter(lambda show: show.start_time < datetime.now(), venue.shows))
   upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), venue.shows))
 
@@ -182,7 +633,6 @@ def show_venue(venue_id):
     }
     past_shows_info.append(show_info)
 
-  
   data={
     "id": venue.id,
     "name": venue.name,
@@ -201,9 +651,570 @@ def show_venue(venue_id):
     "past_shows_count": len(past_shows_info),
     "upcoming_shows_count": len(upcoming_shows_info)
   }
+  return data
 
+def build_artist_data(artist):
+  past_shows = list(filter(lambda show: show.start_time < datetime.now(), artist.shows))
+  upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), artist.shows))
+  past_shows_info = []
+  upcoming_shows_info = []
+  for show in upcoming_shows:
+    show_info = {
+      "venue_id": show.venue_id,
+      "venue_name": show.venue.name,
+      "venue_image_link": show.venue.image_link,
+      "start_time": str(show.start_time)
+    }
+    upcoming_shows_info.append(show_info)
   
-  return render_template('pages/show_venue.html', venue=data)
+  for show in past_shows:
+    show_info = {
+      "venue_id": show.venue_id,
+      "venue_name": show.venue.name,
+      "venue_image_link": show.venue.image_link,
+      "start_time": str(show.start_time)
+    }
+    past_shows_info.append(show_info)
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres.split(','), #changing the genre to an array separated by commas
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website_link": artist.website_link,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description":artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows_info,
+    "upcoming_shows": upcoming_shows_info,
+    "past_shows_count": len(past_shows_info),
+    "upcoming_shows_count": len(upcoming_shows_info)
+  }
+  return data
+
+def next_show_expiry(shows):
+  # the upcoming/past split changes when the next upcoming show starts
+  now = datetime.now()
+  upcoming = [show.start_time for show in shows if show.start_time > now]
+  return page_cache_expiry(min(upcoming).timestamp() if upcoming else None)
+
+def page_cache_expiry(expires_at):
+  # data read from a replica may lack a write the replica has not replayed
+  # yet, so it is cached no longer than the replicas may lag behind
+  if has_request_context() and g.get('use_replica') and db.replicas.healthy:
+    deadline = time.time() + app.config['REPLICA_MAX_LAG_SECONDS']
+    expires_at = deadline if expires_at is None else min(expires_at, deadline)
+  return expires_at
+
+def page_key(kind, entity_id, etag):
+  # page data is cached under the ETag of the page, so no worker can send a
+  # body older than the validators it answers with, whatever it has cached
+  return '{}:{}:{}'.format(kind, entity_id, etag)
+
+def venue_data(venue_id, etag):
+  # returns the data shown on the venue page, or None for an unknown venue
+  key = page_key('venue', venue_id, etag)
+  data = page_cache.get(key)
+  if data is None:
+    # shows and their artists are loaded up front in two extra SELECTs
+    venue = Venue.query.options(
+      selectinload(Venue.shows).joinedload(Show.artist)
+    ).get(venue_id)
+    if venue is None:
+      return None
+    data = build_venue_data(venue)
+    page_cache.set(key, data, expires_at=next_show_expiry(venue.shows))
+  return data
+
+def artist_data(artist_id, etag):
+  # returns the data shown on the artist page, or None for an unknown artist
+  key = page_key('artist', artist_id, etag)
+  data = page_cache.get(key)
+  if data is None:
+    # shows and their venues are loaded up front in two extra SELECTs; the
+    # shows of archived venues are left out until they are purged
+    artist = Artist.query.options(
+      selectinload(Artist.shows.and_(Show.venue.has(*unarchived(Venue)))).joinedload(Show.venue)
+    ).get(artist_id)
+    if artist is None:
+      return None
+    data = build_artist_data(artist)
+    page_cache.set(key, data, expires_at=next_show_expiry(artist.shows))
+  return data
+
+#----------------------------------------------------------------------------#
+# Form data.
+#----------------------------------------------------------------------------#
+
+def venue_values(form):
+  return {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "address": form.address.data,
+    "phone": form.phone.data,
+    "genres": ",".join(form.genres.data), # convert array to string separated by commas
+    "facebook_link": form.facebook_link.data,
+    "image_link": form.image_link.data,
+    "seeking_talent": form.seeking_talent.data,
+    "seeking_description": form.seeking_description.data,
+    "website_link": form.website_link.data
+  }
+
+def artist_values(form):
+  return {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "phone": form.phone.data,
+    "genres": ",".join(form.genres.data), # convert array to string separated by commas
+    "image_link": form.image_link.data,
+    "facebook_link": form.facebook_link.data,
+    "website_link": form.website_link.data,
+    "seeking_venue": form.seeking_venue.data,
+    "seeking_description": form.seeking_description.data
+  }
+
+def show_values(form):
+  return {
+    "artist_id": form.artist_id.data,
+    "venue_id": form.venue_id.data,
+    "start_time": form.start_time.data,
+    "end_time": form.start_time.data + timedelta(minutes=form.duration.data)
+  }
+
+#----------------------------------------------------------------------------#
+# Partial updates.
+#----------------------------------------------------------------------------#
+
+class VersionConflict(Exception):
+  """The row changed since the version the update was based on."""
+
+  def __init__(self, version):
+    super(VersionConflict, self).__init__('the row is now at version {}'.format(version))
+    self.version = version
+
+# columns of a venue or artist shown on the pages of the other side
+LINKED_COLUMNS = {
+  Venue: {'name', 'image_link', 'address', 'city', 'state'},
+  Artist: {'name', 'image_link'},
+}
+
+def update_entity(model, entity_id, values, version=None):
+  # Writes the values that differ from the stored row in one
+  # UPDATE ... WHERE id = ? AND version = ? and commits, without loading the
+  # entity or its shows. Returns (new version, changed columns), or None when
+  # there is no such row. A Core update skips the flush events, so their work
+  # is done here for the changed columns only.
+  table = model.__table__
+  row = db.session.execute(table.select().where(table.c.id == entity_id, *unarchived(model))).first()
+  if row is None:
+    return None
+  if version is not None and row.version != version:
+    raise VersionConflict(row.version)
+  changes = {name: value for name, value in values.items() if row._mapping[name] != value}
+  if not changes:
+    return row.version, []
+  current = dict(row._mapping, **changes)
+  if model is Venue and {'address', 'city', 'state'} & changes.keys():
+    latitude, longitude = geocoder.geocode(current['address'], current['city'], current['state']) or (None, None)
+    changes.update(latitude=latitude, longitude=longitude, geohash=venue_geohash(latitude, longitude))
+
+  updated_at = datetime.utcnow()
+  result = db.session.execute(
+    table.update()
+      .where(table.c.id == entity_id, table.c.version == row.version)
+      .values(version=row.version + 1, updated_at=updated_at, **changes)
+  )
+  if result.rowcount != 1:
+    # changed between the select and the update
+    raise VersionConflict(db.session.execute(db.select(table.c.version).where(table.c.id == entity_id)).scalar())
+  connection = db.session.connection()
+  if 'genres' in changes:
+    sync_genres(connection, model, model.id == entity_id)
+  # every page of the other side showing the old name is touched, a batch
+  # of them here, upcoming shows first, and the rest in the background, so
+  # an edit costs the same whatever the show history
+  batch_size = app.config['LINKED_PAGES_BATCH_SIZE']
+  pending = False
+  if LINKED_COLUMNS[model] & changes.keys():
+    pending = touch_linked_pages(connection, model, entity_id, batch_size, updated_at) == batch_size
+  db.session.commit()
+  if pending:
+    start_linked_touch(model, entity_id, updated_at)
+
+  if model is Venue:
+    venue_index.add(entity_id, venue_document(SimpleNamespace(**current)))
+    fragment_cache.invalidate('venue:{}'.format(entity_id))
+  else:
+    artist_index.add(entity_id, artist_document(SimpleNamespace(**current)))
+    fragment_cache.invalidate('artist:{}'.format(entity_id))
+  return row.version + 1, sorted(changes)
+
+def touch_remaining_linked_pages(model, entity_id, before):
+  batch_size = app.config['LINKED_PAGES_BATCH_SIZE']
+  while True:
+    touched = touch_linked_pages(db.session.connection(), model, entity_id, batch_size, before)
+    db.session.commit()
+    if touched < batch_size:
+      break
+
+def start_linked_touch(model, entity_id, before):
+  def run():
+    with app.app_context():
+      try:
+        touch_remaining_linked_pages(model, entity_id, before)
+      except Exception:
+        app.logger.exception('touching the pages linked to %s %s failed', model.__tablename__, entity_id)
+  threading.Thread(target=run, name='touch-{}-{}'.format(model.__tablename__, entity_id), daemon=True).start()
+
+#----------------------------------------------------------------------------#
+# Genre browsing.
+#----------------------------------------------------------------------------#
+
+def listing_filters(model):
+  # ?genre= and ?state= filters of the venue and artist listings
+  genre = request.args.get('genre') or None
+  state = request.args.get('state') or None
+  filters = list(unarchived(model))
+  if state:
+    filters.append(model.state == state)
+  if genre:
+    link, key = genre_links(model)
+    filters.append(model.id.in_(
+      db.select(link.c[key]).join(Genre, Genre.id == link.c.genre_id).where(Genre.name == genre)
+    ))
+  return genre, state, filters
+
+def genre_facets_query(model, state=None):
+  # (genre, count) pairs for the listing, in one query over the link table.
+  # The genre filter itself is left out so the other genres stay selectable.
+  link, key = genre_links(model)
+  query = db.session.query(Genre.name, db.func.count(link.c[key])) \
+    .join(link, link.c.genre_id == Genre.id)
+  if state:
+    query = query.join(model, model.id == link.c[key]).filter(model.state == state)
+  return query.group_by(Genre.name).order_by(Genre.name)
+
+def genre_facets(model, state=None):
+  return genre_facets_query(model, state).all()
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+def make_etag(*parts):
+  return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def validators_query(model, show_column, entity_id):
+  # the version columns of a venue or artist and the index on shows, read
+  # without loading the entity. Upcoming shows turning into past shows changes
+  # the page too, so the upcoming count and the start of the latest past show
+  # are part of the validators.
+  now = datetime.now()
+  upcoming = db.session.query(db.func.count(Show.id)) \
+    .filter(show_column == model.id, Show.start_time > now) \
+    .scalar_subquery()
+  last_past = db.session.query(db.func.max(Show.start_time)) \
+    .filter(show_column == model.id, Show.start_time <= now) \
+    .scalar_subquery()
+  return db.session.query(model.version, model.updated_at, upcoming, last_past) \
+    .filter(model.id == entity_id, *unarchived(model))
+
+def page_validators(model, entity_id, row):
+  # (etag, last_modified) of a venue or artist page from its validators_query
+  # row, or None when there is no such page
+  if row is None:
+    return None
+  version, updated_at, upcoming_count, last_past_start = row
+  last_modified = updated_at
+  if last_past_start is not None:
+    # show times are local, updated_at is UTC
+    last_modified = max(last_modified, datetime.utcfromtimestamp(last_past_start.timestamp()))
+  return make_etag(model.__tablename__, entity_id, version, updated_at, upcoming_count, last_past_start), last_modified
+
+def entity_validators(model, show_column, entity_id):
+  return page_validators(model, entity_id, validators_query(model, show_column, entity_id).first())
+
+def listing_validators(model):
+  count, updated_at, versions = db.session.query(
+      db.func.count(model.id),
+      db.func.max(model.updated_at),
+      db.func.sum(model.version)
+    ).one()
+  return make_etag(model.__tablename__, count, updated_at, versions), updated_at
+
+def conditional_page(validators, render):
+  # answers with 304 before render() is called when the client's copy is
+  # still current. Pages with pending flashed messages are never validated,
+  # as a later 304 would replay the message.
+  if '_flashes' in session:
+    return render()
+  etag, last_modified = validators
+  if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+    response = Response(status=304)
+  else:
+    response = make_response(render())
+  response.set_etag(etag)
+  if last_modified is not None:
+    response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+request_latency = registry.histogram(
+  'fyyur_request_duration_seconds', 'Request latency by route.',
+  labelnames=('method', 'route', 'status'))
+request_db_time = registry.histogram(
+  'fyyur_request_db_seconds', 'Time spent executing SQL statements per request.',
+  labelnames=('method', 'route'))
+
+def pool_gauge(read):
+  def callback():
+    pool = db.engine.pool
+    if isinstance(pool, QueuePool):
+      return read(pool)
+  return callback
+
+registry.callback('fyyur_db_pool_size', 'Connections kept open by the pool.',
+                  pool_gauge(lambda pool: pool.size()))
+registry.callback('fyyur_db_pool_checked_out', 'Connections currently checked out of the pool.',
+                  pool_gauge(lambda pool: pool.checkedout()))
+registry.callback('fyyur_db_pool_overflow', 'Connections open beyond the pool size.',
+                  pool_gauge(lambda pool: max(pool.overflow(), 0)))
+registry.callback('fyyur_db_replicas_healthy', 'Read replicas currently in use.',
+                  lambda: len(db.replicas.healthy) if db.replicas.engines else None)
+registry.callback('fyyur_page_cache_hits_total', 'Page data cache hits.',
+                  lambda: page_cache.hits, type='counter')
+registry.callback('fyyur_page_cache_misses_total', 'Page data cache misses.',
+                  lambda: page_cache.misses, type='counter')
+registry.callback('fyyur_fragment_cache_hits_total', 'Template fragment cache hits.',
+                  lambda: fragment_cache.hits, type='counter')
+registry.callback('fyyur_fragment_cache_misses_total', 'Template fragment cache misses.',
+                  lambda: fragment_cache.misses, type='counter')
+purged_shows = registry.counter('fyyur_purged_shows_total', 'Shows deleted by venue purges.')
+compression_ratio = registry.histogram(
+  'fyyur_response_compression_ratio', 'Compressed response size as a fraction of the original.',
+  labelnames=('route', 'encoding'), buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0))
+compression_cpu_time = registry.histogram(
+  'fyyur_response_compression_cpu_seconds', 'CPU time spent compressing a response.',
+  labelnames=('route', 'encoding'), buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+  context.statement_started = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context() and 'statements' in g:
+    g.statements.record(statement, time.perf_counter() - context.statement_started)
+
+# Every request counts its statements for the metrics; a sample of them, set
+# by SQL_PROFILE_SAMPLE_RATE, also groups them by normalized text to report
+# repeated statements, and answers with a Server-Timing header unless the
+# response is streamed.
+@app.before_request
+def start_request_timer():
+  g.request_started = time.perf_counter()
+  g.statements = StatementRecorder(
+    track_repeats=random.random() < app.config['SQL_PROFILE_SAMPLE_RATE'])
+
+@app.after_request
+def record_request_metrics(response):
+  if 'request_started' in g:
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    # for the compression metrics, recorded once the body is sent
+    request.environ['fyyur.route'] = route
+    finish = partial(finish_request_metrics, request.method, request.path, route,
+                     response.status_code, g.request_started, g.statements)
+    if response.is_streamed:
+      # a streamed body runs its queries while it is sent, so they are only
+      # all counted once it is closed, too late for a Server-Timing header
+      response.call_on_close(finish)
+    else:
+      finish(response)
+  return response
+
+def finish_request_metrics(method, path, route, status, started, statements, response=None):
+  request_latency.observe(time.perf_counter() - started, method=method, route=route, status=status)
+  request_db_time.observe(statements.seconds, method=method, route=route)
+  if statements.track_repeats:
+    if response is not None:
+      response.headers.add('Server-Timing', statements.server_timing())
+    app.logger.info('%s %s: %d statements in %.1f ms', method, path,
+                    statements.count, statements.seconds * 1000)
+    for statement, count in statements.repeated(app.config['SQL_REPEAT_THRESHOLD']):
+      app.logger.warning('%s %s: statement executed %d times: %s', method, path, count, statement)
+
+#----------------------------------------------------------------------------#
+# Compression.
+#----------------------------------------------------------------------------#
+
+# With COMPRESSION set, responses are gzipped or brotli-compressed as they
+# stream out. Leave it off behind a proxy that compresses already.
+
+def record_compression(environ, encoding, raw_bytes, compressed_bytes, seconds):
+  route = environ.get('fyyur.route', 'unmatched')
+  if raw_bytes:
+    compression_ratio.observe(compressed_bytes / raw_bytes, route=route, encoding=encoding)
+  compression_cpu_time.observe(seconds, route=route, encoding=encoding)
+
+if app.config['COMPRESSION']:
+  app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app,
+    level=app.config['COMPRESSION_LEVEL'],
+    brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+    min_size=app.config['COMPRESSION_MIN_SIZE'],
+    flush_size=app.config['COMPRESSION_FLUSH_SIZE'],
+    observe=record_compression)
+
+#----------------------------------------------------------------------------#
+# Database routing.
+#----------------------------------------------------------------------------#
+
+# GET requests, and the POST views marked with read_only, read from a
+# replica when there is one, except in the views marked with use_primary and
+# for a user who just submitted a change.
+
+def use_primary(view):
+  """Marks a GET view that writes, so it never reads from a replica."""
+  view.use_primary = True
+  return view
+
+def read_only(view):
+  """Marks a POST view that only reads, like a search form."""
+  view.read_only = True
+  return view
+
+def writes_to_primary():
+  view = app.view_functions.get(request.endpoint)
+  if getattr(view, 'use_primary', False):
+    return True
+  return request.method not in ('GET', 'HEAD') and not getattr(view, 'read_only', False)
+
+@app.before_request
+def choose_database():
+  g.use_replica = not writes_to_primary() and session.get('primary_until', 0) < time.time()
+
+@app.after_request
+def stick_to_primary(response):
+  if db.replicas.engines and writes_to_primary():
+    session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+  return response
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+  # renders the template chunk by chunk, so the response starts before the
+  # template has consumed all of its (lazily fetched) data
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.generate(context)))
+
+@app.route('/')
+def index():
+  return render_template('pages/home.html')
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@app.route('/venues')
+def venues():
+  return conditional_page(listing_validators(Venue), render_venues)
+
+def venue_listing_query(page, per_page, filters):
+  # Areas (city/state pairs) are paginated, and the venues of the current page
+  # are fetched with their upcoming show counters in a single query.
+  # One extra area is requested to find out whether there is a next page.
+  areas = db.session.query(Venue.city, Venue.state).distinct() \
+    .filter(*filters) \
+    .order_by(Venue.state, Venue.city) \
+    .limit(per_page + 1).offset((page - 1) * per_page) \
+    .subquery()
+  return db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      Venue.version,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).join(areas, db.and_(Venue.city == areas.c.city, Venue.state == areas.c.state)) \
+    .filter(*filters) \
+    .order_by(Venue.state, Venue.city, Venue.name)
+
+def venue_listing_areas(rows):
+  data = []
+  for (area_city, area_state), area_venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    area_venues = list(area_venues)
+    data.append({
+      "city": area_city,
+      "state": area_state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows
+      } for venue in area_venues],
+      # the venues shown, for the fragment cache key of the area
+      "refs": [('venue', venue.id, venue.version) for venue in area_venues]
+    })
+  return data
+
+def render_venues():
+  page = max(request.args.get('page', 1, type=int), 1)
+  per_page = app.config['AREAS_PER_PAGE']
+  genre, state, filters = listing_filters(Venue)
+  data = venue_listing_areas(venue_listing_query(page, per_page, filters).all())
+  has_next = len(data) > per_page
+  return render_template('pages/venues.html', areas=data[:per_page], page=page, has_next=has_next,
+                         genre=genre, state=state, facets=genre_facets(Venue, state))
+
+@app.route('/venues/search', methods=['POST'])
+@read_only
+def search_venues():
+  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # seach for Hop should return "The Musical Hop".
+  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+  refresh_search_indexes()
+  venue_ids = venue_index.search(request.form.get('search_term', ''))
+  response = search_results(venue_index, venue_ids, count_upcoming_shows(Venue, venue_ids))
+  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+@app.route('/venues/nearby')
+def nearby_venues_page():
+  # the venues nearest to ?lat= and ?lon=, within ?radius= km
+  try:
+    latitude = float(request.args['lat']) if request.args.get('lat') else None
+    longitude = float(request.args['lon']) if request.args.get('lon') else None
+    radius = float(request.args.get('radius') or app.config['NEARBY_RADIUS_KM'])
+    limit = int(request.args.get('limit') or app.config['NEARBY_LIMIT'])
+  except ValueError:
+    abort(400)
+  if (latitude is None) != (longitude is None):
+    abort(400)
+  if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400)
+  if not (0 < radius <= app.config['NEARBY_MAX_RADIUS_KM'] and 0 < limit <= app.config['NEARBY_MAX_LIMIT']):
+    abort(400)
+  results = nearby_venues(latitude, longitude, radius, limit) if latitude is not None else None
+  return render_template('pages/nearby_venues.html', results=results,
+                         lat=latitude, lon=longitude, radius=radius)
+
+@app.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  validators = entity_validators(Venue, Show.venue_id, venue_id)
+  if validators is None:
+    abort(404)
+  return conditional_page(validators, lambda: render_template('pages/show_venue.html',
+                                                              venue=venue_data(venue_id, validators[0])))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -221,21 +1232,10 @@ def create_venue_submission():
   
   if form.validate():
     try:
-      venue = Venue(
-        name=form.name.data,
-        city=form.city.data,
-        state=form.state.data,
-        address=form.address.data,
-        phone=form.phone.data,
-        genres=",".join(form.genres.data),
-        facebook_link=form.facebook_link.data,
-        image_link=form.image_link.data,
-        seeking_talent=form.seeking_talent.data,
-        seeking_description=form.seeking_description.data,
-        website_link=form.website_link.data
-      )
+      venue = Venue(**venue_values(form))
       db.session.add(venue)
       db.session.commit()
+      venue_index.add(venue.id, venue_document(venue))
 
   # on successful db insert, flash success
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -250,18 +1250,39 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>/delete', methods=['GET'])
+@app.route('/venues/<int:venue_id>/delete', methods=['GET'])
+@use_primary
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  # The venue is archived, which hides it at once, and its shows are purged
+  # in batches by a background thread; "flask purge-venues" finishes purges
+  # a restart interrupted.
   try:
-    venue = Venue.query.get(venue_id)
-    db.session.delete(venue)
+    now = datetime.utcnow()
+    table = Venue.__table__
+    name = db.session.query(Venue.name).filter(Venue.id == venue_id, *unarchived(Venue)).scalar()
+    archived = db.session.execute(
+      table.update()
+        .where(table.c.id == venue_id, table.c.archived_at.is_(None))
+        .values(archived_at=now, updated_at=now, version=table.c.version + 1)
+    ).rowcount
+    if archived:
+      # the genre facets count venues through their links
+      link, key = genre_links(Venue)
+      db.session.execute(link.delete().where(link.c[key] == venue_id))
+      # the pages of its artists stop listing it
+      touch_linked_pages(db.session.connection(), Venue, venue_id)
     db.session.commit()
-    flash("Venue " + venue.name + " was deleted successfully!")
   except:
     db.session.rollback()
     flash("Venue was not deleted successfully.")
+  else:
+    if not archived:
+      abort(404)
+    venue_index.remove(venue_id)
+    fragment_cache.invalidate('venue:{}'.format(venue_id))
+    if app.config['PURGE_IN_BACKGROUND']:
+      start_purge(venue_id)
+    flash("Venue " + name + " was deleted successfully!")
   finally:
     db.session.close()
 
@@ -273,80 +1294,39 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data = db.session.query(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=data)
+  return conditional_page(listing_validators(Artist), render_artists)
+
+def render_artists():
+  genre, state, filters = listing_filters(Artist)
+  data = db.session.query(Artist.id, Artist.name).filter(*filters).all()
+  return render_template('pages/artists.html', artists=data,
+                         genre=genre, state=state, facets=genre_facets(Artist, state))
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  artists = Artist.query.filter(Artist.name.ilike('%{}%'.format(request.form['search_term']))).all()
-
-  response= {
-    "count": len(artists),
-    "data": []
-  }
-  for artist in artists:
-    response['data'].append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), artist.shows))),
-    })
+  refresh_search_indexes()
+  artist_ids = artist_index.search(request.form.get('search_term', ''))
+  response = search_results(artist_index, artist_ids, count_upcoming_shows(Artist, artist_ids))
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  artist = Artist.query.get(artist_id)
-  past_shows = list(filter(lambda show: show.start_time < datetime.now(), artist.shows))
-  upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), artist.shows))
-  past_shows_info = []
-  upcoming_shows_info = []
-  for show in upcoming_shows:
-    show_info = {
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    }
-    upcoming_shows_info.append(show_info)
-  
-  for show in past_shows:
-    show_info = {
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    }
-    past_shows_info.append(show_info)
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres.split(','), #changing the genre to an array separated by commas
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website_link": artist.website_link,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description":artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_shows_info,
-    "upcoming_shows": upcoming_shows_info,
-    "past_shows_count": len(past_shows_info),
-    "upcoming_shows_count": len(upcoming_shows_info)
-  }
-  return render_template('pages/show_artist.html', artist=data)
+  validators = entity_validators(Artist, Show.artist_id, artist_id)
+  if validators is None:
+    abort(404)
+  return conditional_page(validators, lambda: render_template('pages/show_artist.html',
+                                                              artist=artist_data(artist_id, validators[0])))
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.get_or_404(artist_id)
   artist_info={
     "id": artist.id,
     "name": artist.name,
@@ -358,48 +1338,41 @@ def edit_artist(artist_id):
     "facebook_link": artist.facebook_link,
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link
+    "image_link": artist.image_link,
+    "version": artist.version
   }
-  # artist = Artist.query.get(artist_id)
-  # form.genres.data = artist.genres.split(",") # changing the genre to an array separated by commas
-  # TODO: populate form with fields from artist with ID <artist_id>
+  # the form starts from the stored values, so only the fields the user
+  # changes differ from the row when it is submitted
+  form = ArtistForm(data=artist_info)
   return render_template('forms/edit_artist.html', form=form, artist=artist_info)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
+  # only the fields that changed are written, and only when nobody else
+  # edited the artist since the form was rendered
   form = ArtistForm(request.form)
   if form.validate():
     try:
-      artist = Artist.query.get(artist_id)
-
-      artist.name = form.name.data
-      artist.city=form.city.data
-      artist.state=form.state.data
-      artist.phone=form.phone.data
-      artist.genres=",".join(form.genres.data) # changing the genre to an array separated by commas
-      artist.facebook_link=form.facebook_link.data
-      artist.image_link=form.image_link.data
-      artist.seeking_venue=form.seeking_venue.data
-      artist.seeking_description=form.seeking_description.data
-      artist.website_link=form.website_link.data
-
-      db.session.add(artist)
-      db.session.commit()
-      flash("Artist " + artist.name + " was successfully edited!")
+      result = update_entity(Artist, artist_id, artist_values(form), request.form.get('version', type=int))
+    except VersionConflict:
+      db.session.rollback()
+      flash('Artist ' + form.name.data + ' was changed by someone else while you were editing it. Please check the changes and try again.')
+      return redirect(url_for('edit_artist', artist_id=artist_id))
     except:
       db.session.rollback()
       flash("Artist was not edited successfully.")
+    else:
+      if result is None:
+        abort(404)
+      flash("Artist " + form.name.data + " was successfully edited!")
     finally:
       db.session.close()
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
 
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue_info = Venue.query.get(venue_id)
+  venue_info = Venue.query.filter(Venue.id == venue_id, *unarchived(Venue)).first_or_404()
   venue={
     "id": venue_info.id,
     "name": venue_info.name,
@@ -412,40 +1385,35 @@ def edit_venue(venue_id):
     "facebook_link": venue_info.facebook_link,
     "seeking_talent": venue_info.seeking_talent,
     "seeking_description": venue_info.seeking_description,
-    "image_link": venue_info.image_link
+    "image_link": venue_info.image_link,
+    "version": venue_info.version
   }
-  # TODO: populate form with values from venue with ID <venue_id>
+  # the form starts from the stored values, so only the fields the user
+  # changes differ from the row when it is submitted
+  form = VenueForm(data=venue)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+  # only the fields that changed are written, and only when nobody else
+  # edited the venue since the form was rendered
   form = VenueForm(request.form)
-    
   if form.validate():
     try:
-      venue = Venue.query.get(venue_id)
-      venue.name = form.name.data
-      venue.city=form.city.data
-      venue.state=form.state.data
-      venue.address=form.address.data
-      venue.phone=form.phone.data
-      venue.genres=",".join(form.genres.data) # convert array to string separated by commas
-      venue.facebook_link=form.facebook_link.data
-      venue.image_link=form.image_link.data
-      venue.seeking_talent=form.seeking_talent.data
-      venue.seeking_description=form.seeking_description.data
-      venue.website_link=form.website_link.data
-      db.session.add(venue)
-      db.session.commit()
-      db.session.commit()
-      flash('Venue ' + request.form['name'] + ' was successfully updated!')
+      result = update_entity(Venue, venue_id, venue_values(form), request.form.get('version', type=int))
+    except VersionConflict:
+      db.session.rollback()
+      flash('Venue ' + form.name.data + ' was changed by someone else while you were editing it. Please check the changes and try again.')
+      return redirect(url_for('edit_venue', venue_id=venue_id))
     except:
       db.session.rollback()
-      flash('An error occurred. Venue ' + new_venue.name + ' could not be updated.')
+      flash('An error occurred. Venue ' + form.name.data + ' could not be updated.')
+    else:
+      if result is None:
+        abort(404)
+      flash('Venue ' + form.name.data + ' was successfully updated!')
     finally:
       db.session.close()
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -462,20 +1430,10 @@ def create_artist_submission():
 
   if form.validate():
     try:
-      new_artist = Artist(
-        name=form.name.data,
-        city=form.city.data,
-        state=form.state.data,
-        phone=form.phone.data,
-        genres=",".join(form.genres.data), # convert array to string separated by commas
-        image_link=form.image_link.data,
-        facebook_link=form.facebook_link.data,
-        website_link=form.website_link.data,
-        seeking_venue=form.seeking_venue.data,
-        seeking_description=form.seeking_description.data,
-      )
+      new_artist = Artist(**artist_values(form))
       db.session.add(new_artist)
       db.session.commit()
+      artist_index.add(new_artist.id, artist_document(new_artist))
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
@@ -495,22 +1453,93 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+SHOW_FILTERS = ('from', 'to', 'city', 'state', 'venue_id', 'artist_id')
+
+def parse_show_time(value, end=False):
+  # ?from= and ?to= take a date or a date and time. A date given as the end
+  # of the range includes the whole day.
+  try:
+    if 'T' in value or ' ' in value:
+      return datetime.fromisoformat(value)
+    day = datetime.fromisoformat(value)
+  except ValueError:
+    abort(400)
+  return day + timedelta(days=1) if end else day
+
+def show_filters():
+  # the filter arguments of the shows listing, kept on its pager links
+  filters = {name: request.args[name] for name in SHOW_FILTERS if request.args.get(name)}
+  for name in ('venue_id', 'artist_id'):
+    if name in filters and not filters[name].isdigit():
+      abort(400)
+  return filters
+
+def shows_page_query(per_page):
+  # the shows selected by the request arguments, with the arguments of the
+  # KeysetPage their rows go in. The time range is a range scan on
+  # ix_Show_start_time, or on the venue or artist index when one is given.
+  filters = show_filters()
+  upcoming_only = 'from' not in filters and request.args.get('upcoming', '1') != '0'
+  try:
+    after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    before = decode_cursor(request.args['before']) if 'before' in request.args else None
+  except ValueError:
+    abort(400)
+
+  query = db.session.query(
+      Show.id,
+      Show.version,
+      Show.start_time,
+      Show.venue_id,
+      Venue.version.label('venue_version'),
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.version.label('artist_version'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Venue, db.and_(Show.venue_id == Venue.id, *unarchived(Venue))) \
+    .join(Artist, Show.artist_id == Artist.id)
+  if 'from' in filters:
+    query = query.filter(Show.start_time >= parse_show_time(filters['from']))
+  elif upcoming_only:
+    query = query.filter(Show.start_time > datetime.now())
+  if 'to' in filters:
+    query = query.filter(Show.start_time < parse_show_time(filters['to'], end=True))
+  if 'city' in filters:
+    query = query.filter(Venue.city == filters['city'])
+  if 'state' in filters:
+    query = query.filter(Venue.state == filters['state'])
+  if 'venue_id' in filters:
+    query = query.filter(Show.venue_id == int(filters['venue_id']))
+  if 'artist_id' in filters:
+    query = query.filter(Show.artist_id == int(filters['artist_id']))
+  if before:
+    start_time, show_id = before
+    query = query.filter(db.or_(
+        Show.start_time < start_time,
+        db.and_(Show.start_time == start_time, Show.id < show_id)
+      )).order_by(Show.start_time.desc(), Show.id.desc())
+  else:
+    if after:
+      start_time, show_id = after
+      query = query.filter(db.or_(
+          Show.start_time > start_time,
+          db.and_(Show.start_time == start_time, Show.id > show_id)
+        ))
+    query = query.order_by(Show.start_time, Show.id)
+  return query.limit(per_page + 1), {
+    "key": lambda show: (show.start_time, show.id),
+    "backwards": before is not None,
+    "has_previous": after is not None
+  }, upcoming_only, filters
+
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  shows = Show.query.all()
-  data = []
-  for show in shows:
-    data.append({
-    "venue_id": show.venue_id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist_id,
-    "artist_name": show.artist.name,
-    "artist_image_link": show.artist.image_link,
-    "start_time": str(show.start_time)
-    })
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one keyset page at a time
+  per_page = app.config['SHOWS_PER_PAGE']
+  query, page_args, upcoming_only, filters = shows_page_query(per_page)
+  page = KeysetPage(query, per_page, **page_args)
+  return stream_template('pages/shows.html', shows=page, upcoming=upcoming_only, filters=filters)
 
 @app.route('/shows/create')
 def create_shows():
@@ -524,11 +1553,7 @@ def create_show_submission():
   
   if form.validate():
     try:
-      new_show = Show(
-        artist_id=form.artist_id.data,
-        venue_id=form.venue_id.data,
-        start_time=form.start_time.data
-      )
+      new_show = Show(**show_values(form))
       db.session.add(new_show)
       db.session.commit()
   # called to create new shows in the db, upon submitting new show listing form
@@ -539,6 +1564,9 @@ def create_show_submission():
   # TODO: on unsuccessful db insert, flash an error instead.
   # e.g., flash('An error occurred. Show could not be listed.')
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+    except BookingError as error:
+      db.session.rollback()
+      flash('Show was not listed: {}.'.format(error))
     except:
       db.session.rollback()
       flash('Show was not successfully listed.')
@@ -546,6 +1574,492 @@ def create_show_submission():
       db.session.close()
   return render_template('pages/home.html')
 
+#  Calendars
+#  ----------------------------------------------------------------
+
+def escape_ics(text):
+  return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold_ics(line):
+  # content lines are at most 75 octets, continued on lines starting with a space
+  parts, part, size, limit = [], '', 0, 75
+  for char in line:
+    width = len(char.encode('utf-8'))
+    if size + width > limit:
+      parts.append(part)
+      part, size, limit = '', 0, 74
+    part += char
+    size += width
+  parts.append(part)
+  return '\r\n '.join(parts) + '\r\n'
+
+def show_event(show, stamp, host):
+  # show times are local, so they are written as floating times
+  location = ', '.join(part for part in (show.venue_name, show.address, show.city, show.state) if part)
+  lines = [
+    'BEGIN:VEVENT',
+    'UID:show-{}@{}'.format(show.id, host),
+    'DTSTAMP:' + stamp,
+    'DTSTART:' + show.start_time.strftime('%Y%m%dT%H%M%S'),
+    'DTEND:' + show.end_time.strftime('%Y%m%dT%H%M%S'),
+    'SUMMARY:' + escape_ics('{} at {}'.format(show.artist_name, show.venue_name)),
+    'LOCATION:' + escape_ics(location),
+    'END:VEVENT',
+  ]
+  return ''.join(fold_ics(line) for line in lines)
+
+def calendar_feed(name, show_column, entity_id, last_modified):
+  # yields the calendar a batch of events at a time, reading the shows with
+  # yield_per so a long history is never held in memory
+  batch_size = app.config['CALENDAR_BATCH_SIZE']
+  stamp = last_modified.strftime('%Y%m%dT%H%M%SZ')
+  host = request.host
+  yield ''.join(fold_ics(line) for line in (
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'PRODID:-//Fyyur//Shows//EN',
+    'X-WR-CALNAME:' + escape_ics(name),
+  ))
+  shows = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.end_time,
+      Artist.name.label('artist_name'),
+      Venue.name.label('venue_name'),
+      Venue.address,
+      Venue.city,
+      Venue.state
+    ).join(Venue, db.and_(Show.venue_id == Venue.id, *unarchived(Venue))) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .filter(show_column == entity_id) \
+    .order_by(Show.start_time, Show.id) \
+    .yield_per(batch_size)
+  events = []
+  for show in shows:
+    events.append(show_event(show, stamp, host))
+    if len(events) == batch_size:
+      yield ''.join(events)
+      events = []
+  yield ''.join(events) + 'END:VCALENDAR\r\n'
+
+def calendar_response(model, show_column, entity_id):
+  # calendar clients poll their feeds, so the feed is validated like the
+  # page before any show is read
+  validators = entity_validators(model, show_column, entity_id)
+  if validators is None:
+    abort(404)
+  etag, last_modified = validators
+  name = db.session.query(model.name).filter(model.id == entity_id).scalar()
+  return conditional_page((make_etag('ics', etag), last_modified), lambda: Response(
+    stream_with_context(calendar_feed(name, show_column, entity_id, last_modified)),
+    mimetype='text/calendar'
+  ))
+
+@app.route('/venues/<int:venue_id>/shows.ics')
+def venue_calendar(venue_id):
+  return calendar_response(Venue, Show.venue_id, venue_id)
+
+@app.route('/artists/<int:artist_id>/shows.ics')
+def artist_calendar(artist_id):
+  return calendar_response(Artist, Show.artist_id, artist_id)
+
+#  API
+#  ----------------------------------------------------------------
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_COLUMNS = (
+  'id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website_link',
+  'facebook_link', 'seeking_talent', 'seeking_description', 'image_link'
+)
+ARTIST_COLUMNS = (
+  'id', 'name', 'genres', 'city', 'state', 'phone', 'website_link',
+  'facebook_link', 'seeking_venue', 'seeking_description', 'image_link'
+)
+# fields that need the shows, built with the same code as the HTML pages
+PAGE_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count')
+
+def json_response(payload, status=200):
+  if orjson is not None:
+    body = orjson.dumps(payload)
+  else:
+    body = json.dumps(payload, separators=(',', ':'))
+  return Response(body, status=status, mimetype='application/json')
+
+def api_error(status, message):
+  return json_response({"error": message}, status=status)
+
+def parse_fields(available, default):
+  if 'fields' not in request.args:
+    return list(default)
+  fields = [field for field in request.args['fields'].split(',') if field]
+  unknown = [field for field in fields if field not in available]
+  if unknown:
+    abort(api_error(400, 'Unknown fields: ' + ', '.join(unknown)))
+  return fields
+
+def parse_ids():
+  # ?ids=1,2,3 fetches those rows in one IN query instead of a page
+  if 'ids' not in request.args:
+    return None
+  try:
+    ids = [int(value) for value in request.args['ids'].split(',') if value]
+  except ValueError:
+    abort(api_error(400, 'ids must be a comma separated list of integers'))
+  if len(ids) > app.config['API_MAX_PAGE_SIZE']:
+    abort(api_error(400, 'At most {} ids can be fetched at once'.format(app.config['API_MAX_PAGE_SIZE'])))
+  return ids
+
+def paginate_by_id(query, id_column, ids):
+  # returns (rows, next_cursor); the cursor is the last id of the page
+  if ids is not None:
+    position = {entity_id: index for index, entity_id in enumerate(ids)}
+    rows = query.filter(id_column.in_(ids)).all()
+    return sorted(rows, key=lambda row: position[row.id]), None
+  limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+  limit = max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+  after = request.args.get('cursor', type=int)
+  if after is not None:
+    query = query.filter(id_column > after)
+  rows = query.order_by(id_column).limit(limit + 1).all()
+  if len(rows) > limit:
+    rows = rows[:limit]
+    return rows, str(rows[-1].id)
+  return rows, None
+
+def api_entities(model, columns, page_loader, build_data, fields, ids):
+  # Only the requested columns are selected; the shows are loaded only when
+  # a page field is requested and then go through build_venue_data /
+  # build_artist_data like the HTML pages.
+  if any(field in PAGE_FIELDS for field in fields):
+    query = model.query.options(page_loader)
+  else:
+    selected = ['id'] + [field for field in fields if field in columns and field != 'id']
+    query = db.session.query(*[getattr(model, column) for column in selected])
+  query = query.filter(*unarchived(model))
+  rows, next_cursor = paginate_by_id(query, model.id, ids)
+
+  upcoming_shows = {}
+  if 'num_upcoming_shows' in fields:
+    upcoming_shows = count_upcoming_shows(model, [row.id for row in rows])
+
+  data = []
+  for row in rows:
+    if isinstance(row, model):
+      source = build_data(row)
+    else:
+      source = row._asdict()
+      if 'genres' in source:
+        source['genres'] = (source['genres'] or '').split(',')
+    source['num_upcoming_shows'] = upcoming_shows.get(row.id, 0)
+    data.append({field: source[field] for field in fields})
+  return data, next_cursor
+
+def venue_page_loader():
+  return selectinload(Venue.shows).joinedload(Show.artist)
+
+def artist_page_loader():
+  # the shows of archived venues are left out, as on the artist page
+  return selectinload(Artist.shows.and_(Show.venue.has(*unarchived(Venue)))).joinedload(Show.venue)
+
+def json_type_errors(form, payload):
+  # the form coerces whatever it is given, a number to the string "5" and
+  # "no" to True, so the JSON types are checked before it sees the values
+  errors = {}
+  for name, value in payload.items():
+    field = form[name]
+    if isinstance(field, BooleanField):
+      expected, valid = 'a boolean', isinstance(value, bool)
+    elif isinstance(field, SelectMultipleField):
+      expected, valid = 'a list of strings', isinstance(value, list) and all(isinstance(item, str) for item in value)
+    else:
+      expected, valid = 'a string', isinstance(value, str)
+    if not valid:
+      errors[name] = ['Expected ' + expected]
+  return errors
+
+def api_update(model, form_class, to_values, entity_id):
+  # PATCH with a JSON object of the fields to change and the version they
+  # are based on; answers with the new version and the changed fields
+  payload = request.get_json(silent=True)
+  if not isinstance(payload, dict):
+    return api_error(400, 'Expected a JSON object')
+  payload = dict(payload)
+  version = payload.pop('version', None)
+  if not isinstance(version, int) or isinstance(version, bool):
+    return api_error(400, 'version is required')
+  # fields left out of the payload are dropped below; genres only needs a
+  # value that to_values can join
+  form = form_class(formdata=None, data=dict({'genres': []}, **payload), meta={'csrf': False})
+  unknown = [name for name in payload if name not in form or name == 'csrf_token']
+  if unknown:
+    return api_error(400, 'Unknown fields: ' + ', '.join(unknown))
+  errors = json_type_errors(form, payload) or \
+    {name: form[name].errors for name in payload if not form[name].validate(form)}
+  if errors:
+    return json_response({"error": "Invalid fields", "fields": errors}, status=400)
+  values = {name: value for name, value in to_values(form).items() if name in payload}
+  try:
+    result = update_entity(model, entity_id, values, version)
+  except VersionConflict as conflict:
+    db.session.rollback()
+    return json_response({"error": "Version conflict", "version": conflict.version}, status=409)
+  if result is None:
+    return api_error(404, '{} not found'.format(model.__tablename__))
+  version, changed = result
+  return json_response({"id": entity_id, "version": version, "changed": changed})
+
+@api.route('/venues')
+def api_venues():
+  fields = parse_fields(VENUE_COLUMNS + PAGE_FIELDS + ('num_upcoming_shows',),
+                        default=('id', 'name', 'city', 'state', 'num_upcoming_shows'))
+  data, next_cursor = api_entities(Venue, VENUE_COLUMNS, venue_page_loader(),
+                                   build_venue_data, fields, parse_ids())
+  return json_response({"data": data, "next_cursor": next_cursor})
+
+@api.route('/venues/<int:venue_id>')
+def api_venue(venue_id):
+  fields = parse_fields(VENUE_COLUMNS + PAGE_FIELDS + ('num_upcoming_shows',),
+                        default=VENUE_COLUMNS + PAGE_FIELDS)
+  data, _ = api_entities(Venue, VENUE_COLUMNS, venue_page_loader(),
+                         build_venue_data, fields, [venue_id])
+  if not data:
+    return api_error(404, 'Venue not found')
+  return json_response(data[0])
+
+@api.route('/venues/<int:venue_id>', methods=['PATCH'])
+def api_update_venue(venue_id):
+  return api_update(Venue, VenueForm, venue_values, venue_id)
+
+@api.route('/artists')
+def api_artists():
+  fields = parse_fields(ARTIST_COLUMNS + PAGE_FIELDS + ('num_upcoming_shows',),
+                        default=('id', 'name', 'city', 'state', 'num_upcoming_shows'))
+  data, next_cursor = api_entities(Artist, ARTIST_COLUMNS, artist_page_loader(),
+                                   build_artist_data, fields, parse_ids())
+  return json_response({"data": data, "next_cursor": next_cursor})
+
+@api.route('/artists/<int:artist_id>')
+def api_artist(artist_id):
+  fields = parse_fields(ARTIST_COLUMNS + PAGE_FIELDS + ('num_upcoming_shows',),
+                        default=ARTIST_COLUMNS + PAGE_FIELDS)
+  data, _ = api_entities(Artist, ARTIST_COLUMNS, artist_page_loader(),
+                         build_artist_data, fields, [artist_id])
+  if not data:
+    return api_error(404, 'Artist not found')
+  return json_response(data[0])
+
+@api.route('/artists/<int:artist_id>', methods=['PATCH'])
+def api_update_artist(artist_id):
+  return api_update(Artist, ArtistForm, artist_values, artist_id)
+
+SHOW_FIELDS = {
+  'id': Show.id,
+  'start_time': Show.start_time,
+  'end_time': Show.end_time,
+  'venue_id': Show.venue_id,
+  'venue_name': Venue.name,
+  'venue_image_link': Venue.image_link,
+  'artist_id': Show.artist_id,
+  'artist_name': Artist.name,
+  'artist_image_link': Artist.image_link,
+}
+
+@api.route('/shows')
+def api_shows():
+  fields = parse_fields(SHOW_FIELDS, default=SHOW_FIELDS)
+  selected = ['id'] + [field for field in fields if field != 'id']
+  query = db.session.query(*[SHOW_FIELDS[field].label(field) for field in selected])
+  # venues are always joined, to leave out the shows of archived venues;
+  # artists only when one of their columns is requested
+  query = query.join(Venue, db.and_(Show.venue_id == Venue.id, *unarchived(Venue)))
+  if any(field.startswith('artist_') and field != 'artist_id' for field in fields):
+    query = query.join(Artist, Show.artist_id == Artist.id)
+  rows, next_cursor = paginate_by_id(query, Show.id, parse_ids())
+
+  data = []
+  for row in rows:
+    show = row._asdict()
+    for field in ('start_time', 'end_time'):
+      if field in show:
+        show[field] = str(show[field])
+    data.append({field: show[field] for field in fields})
+  return json_response({"data": data, "next_cursor": next_cursor})
+
+app.register_blueprint(api)
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def prometheus_metrics():
+  return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+#  Async read path
+#  ----------------------------------------------------------------
+
+# The read pages again under /async, served by async views that run their
+# independent queries concurrently through SQLAlchemy's asyncio extension.
+# The queries are shared with the sync views; only their execution differs.
+# Requests read from the same replica or primary as they would in a sync
+# view, and cache what a replica returned no longer than the sync views do.
+
+aio = Blueprint('aio', __name__, url_prefix='/async')
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+# the columns and the other side of the shows listed on venue and artist pages
+PAGE_SHOWS = {
+  Venue: ('venue', VENUE_COLUMNS, Show.venue_id, Show.artist_id, Artist, 'artist'),
+  Artist: ('artist', ARTIST_COLUMNS, Show.artist_id, Show.venue_id, Venue, 'venue'),
+}
+# async engines by the sync engine of the replica they read from, None for
+# the primary
+async_engines = {}
+async_engine_lock = threading.Lock()
+
+async def open_first_connection(engine):
+  async with engine.connect():
+    pass
+
+def get_async_engine(replica=None):
+  # Flask runs every async view in an event loop of its own, and asyncpg and
+  # aiosqlite connections belong to the loop that opened them, so they are
+  # not pooled across requests.
+  with async_engine_lock:
+    engine = async_engines.get(replica)
+    if engine is not None:
+      return engine
+    if replica is not None:
+      url = replica.url.set(drivername=ASYNC_DRIVERS[replica.url.get_backend_name()])
+    else:
+      url = make_url(app.config['ASYNC_DATABASE_URL'] or app.config['SQLALCHEMY_DATABASE_URI'])
+      if '+' not in url.drivername:
+        url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    options = {'poolclass': NullPool}
+    if url.get_backend_name() == 'postgresql' and app.config['DB_STATEMENT_TIMEOUT']:
+      options['connect_args'] = {'server_settings': {'statement_timeout': str(app.config['DB_STATEMENT_TIMEOUT'])}}
+    engine = create_async_engine(url, **options)
+    # The first connection sets up the dialect behind an asyncio lock that
+    # only works in one event loop, so it is opened here, from a loop of its
+    # own, before requests running in other loops share the engine.
+    thread = threading.Thread(target=asyncio.run, args=(open_first_connection(engine),))
+    thread.start()
+    thread.join()
+    async_engines[replica] = engine
+  return engine
+
+def request_async_engine():
+  # the async engine of the replica the request reads from, chosen once per
+  # request like the sync session's, or of the primary
+  if not has_request_context():
+    return get_async_engine()
+  if 'async_replica' not in g:
+    g.async_replica = db.replicas.choose() if g.get('use_replica') else None
+  return get_async_engine(g.async_replica)
+
+async def fetch_all(engine, statement):
+  async with engine.connect() as connection:
+    return (await connection.execute(statement)).all()
+
+async def fetch_concurrently(*statements):
+  # runs the statements at the same time, each on a connection of its own
+  engine = request_async_engine()
+  return await asyncio.gather(*[fetch_all(engine, statement) for statement in statements])
+
+async def async_page_data(model, entity_id):
+  # the data of the venue or artist page, the same as venue_data and
+  # artist_data return, from the entity, upcoming and past show queries
+  kind, columns, show_column, other_column, other, other_kind = PAGE_SHOWS[model]
+  rows, = await fetch_concurrently(validators_query(model, show_column, entity_id).statement)
+  validators = page_validators(model, entity_id, rows[0] if rows else None)
+  if validators is None:
+    return None
+  key = page_key(kind, entity_id, validators[0])
+  data = page_cache.get(key)
+  if data is not None:
+    return data
+  now = datetime.now()
+  shows = db.select(
+      other_column.label(other_kind + '_id'),
+      other.name.label(other_kind + '_name'),
+      other.image_link.label(other_kind + '_image_link'),
+      Show.start_time
+    ).join(other, db.and_(other_column == other.id, *unarchived(other))).where(show_column == entity_id)
+  entities, upcoming, past = await fetch_concurrently(
+    db.select(*[getattr(model, column) for column in columns]).where(model.id == entity_id, *unarchived(model)),
+    shows.where(Show.start_time > now),
+    shows.where(Show.start_time < now)
+  )
+  if not entities:
+    return None
+  data = dict(entities[0]._mapping)
+  data['genres'] = data['genres'].split(',')
+  for name, rows in (('past_shows', past), ('upcoming_shows', upcoming)):
+    data[name] = [dict(row._mapping, start_time=str(row.start_time)) for row in rows]
+    data[name + '_count'] = len(rows)
+  expires_at = min(row.start_time for row in upcoming).timestamp() if upcoming else None
+  page_cache.set(key, data, expires_at=page_cache_expiry(expires_at))
+  return data
+
+async def async_search(model, index):
+  # the search indexes live in memory; only the counters come from the database
+  refresh_search_indexes()
+  ids = index.search(request.form.get('search_term', ''))
+  upcoming_shows = {}
+  if ids:
+    rows, = await fetch_concurrently(upcoming_shows_query(model, ids).statement)
+    upcoming_shows = dict(rows)
+  return search_results(index, ids, upcoming_shows)
+
+@aio.route('/venues')
+async def async_venues():
+  page = max(request.args.get('page', 1, type=int), 1)
+  per_page = app.config['AREAS_PER_PAGE']
+  genre, state, filters = listing_filters(Venue)
+  rows, facets = await fetch_concurrently(
+    venue_listing_query(page, per_page, filters).statement,
+    genre_facets_query(Venue, state).statement
+  )
+  data = venue_listing_areas(rows)
+  return render_template('pages/venues.html', areas=data[:per_page], page=page, has_next=len(data) > per_page,
+                         genre=genre, state=state, facets=facets)
+
+@aio.route('/venues/search', methods=['POST'])
+@read_only
+async def async_search_venues():
+  return render_template('pages/search_venues.html', results=await async_search(Venue, venue_index),
+                         search_term=request.form.get('search_term', ''))
+
+@aio.route('/venues/<int:venue_id>')
+async def async_show_venue(venue_id):
+  data = await async_page_data(Venue, venue_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_venue.html', venue=data)
+
+@aio.route('/artists/search', methods=['POST'])
+@read_only
+async def async_search_artists():
+  return render_template('pages/search_artists.html', results=await async_search(Artist, artist_index),
+                         search_term=request.form.get('search_term', ''))
+
+@aio.route('/artists/<int:artist_id>')
+async def async_show_artist(artist_id):
+  data = await async_page_data(Artist, artist_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=data)
+
+@aio.route('/shows')
+async def async_shows():
+  per_page = app.config['SHOWS_PER_PAGE']
+  query, page_args, upcoming_only, filters = shows_page_query(per_page)
+  rows, = await fetch_concurrently(query.statement)
+  return render_template('pages/shows.html', shows=KeysetPage(rows, per_page, **page_args),
+                         upcoming=upcoming_only, filters=filters)
+
+app.register_blueprint(aio)
+
 @app.errorhandler(404)
 def not_found_error(error):
   return render_template('errors/404.html'), 404
@@ -554,6 +2068,235 @@ def not_found_error(error):
 def server_error(error):
   return render_template('errors/500.html'), 500
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def resolve_show_references(rows, reject):
+  # checks the venue and artist ids of a whole batch with two IN queries, and
+  # every show for booking conflicts in the database and within the batch
+  valid = []
+  for line_number, show in rows:
+    try:
+      show['venue_id'] = int(show['venue_id'])
+      show['artist_id'] = int(show['artist_id'])
+    except (TypeError, ValueError):
+      reject(line_number, 'venue_id and artist_id must be integers')
+      continue
+    valid.append((line_number, show))
+  venue_ids = {show['venue_id'] for _, show in valid}
+  artist_ids = {show['artist_id'] for _, show in valid}
+  known_venues = {row.id for row in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids), *unarchived(Venue))}
+  known_artists = {row.id for row in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  resolved = []
+  # shows accepted so far in this batch, by venue and by artist
+  booked = {}
+  connection = db.session.connection()
+  for line_number, show in valid:
+    if show['venue_id'] not in known_venues:
+      reject(line_number, 'unknown venue_id {}'.format(show['venue_id']))
+      continue
+    if show['artist_id'] not in known_artists:
+      reject(line_number, 'unknown artist_id {}'.format(show['artist_id']))
+      continue
+    conflict = find_booking_conflict(connection, show['venue_id'], show['artist_id'],
+                                     show['start_time'], show['end_time'])
+    if conflict is None:
+      for key in (('venue', show['venue_id']), ('artist', show['artist_id'])):
+        for other_line, other in booked.get(key, ()):
+          if other['start_time'] < show['end_time'] and show['start_time'] < other['end_time']:
+            conflict = 'the {} is already booked by line {}'.format(key[0], other_line)
+            break
+        if conflict is not None:
+          break
+    if conflict is not None:
+      reject(line_number, conflict)
+      continue
+    booked.setdefault(('venue', show['venue_id']), []).append((line_number, show))
+    booked.setdefault(('artist', show['artist_id']), []).append((line_number, show))
+    resolved.append((line_number, show))
+  return resolved
+
+def touch_imported_shows(shows):
+  # bulk inserts bypass the ORM events that move the page validators, which
+  # key the cached page data, and keep the show counters current
+  venue_ids = {show['venue_id'] for show in shows}
+  artist_ids = {show['artist_id'] for show in shows}
+  now = datetime.utcnow()
+  db.session.execute(Venue.__table__.update().where(Venue.id.in_(venue_ids)).values(updated_at=now))
+  db.session.execute(Artist.__table__.update().where(Artist.id.in_(artist_ids)).values(updated_at=now))
+  connection = db.session.connection()
+  refresh_show_counters(connection, Venue, Show.venue_id, Venue.id.in_(venue_ids))
+  refresh_show_counters(connection, Artist, Show.artist_id, Artist.id.in_(artist_ids))
+
+def sync_imported_genres(model):
+  # Core inserts skip the genre events, so the rows added since the previous
+  # batch are linked after each batch
+  last_id = [db.session.query(db.func.max(model.id)).scalar() or 0]
+  def after_batch(rows):
+    sync_genres(db.session.connection(), model, model.id > last_id[0])
+    last_id[0] = db.session.query(db.func.max(model.id)).scalar() or 0
+  return after_batch
+
+def located_venue_values(form):
+  # Core inserts skip locate_venue, so imported venues are placed here
+  values = venue_values(form)
+  latitude, longitude = geocoder.geocode(values['address'], values['city'], values['state']) or (None, None)
+  return dict(values, latitude=latitude, longitude=longitude, geohash=venue_geohash(latitude, longitude))
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per INSERT (IMPORT_BATCH_SIZE).')
+@click.option('--copy/--no-copy', 'use_copy', default=None,
+              help='Load batches with COPY; the default on PostgreSQL.')
+def import_command(kind, source, fmt, batch_size, use_copy):
+  """Streams venues, artists or shows from a CSV or JSON Lines file."""
+  if fmt is None:
+    fmt = 'jsonl' if source.name.endswith(('.jsonl', '.json')) else 'csv'
+  if use_copy is None:
+    use_copy = db.engine.dialect.name == 'postgresql'
+  if kind == 'venues':
+    options = dict(table=Venue.__table__, form_class=VenueForm, to_values=located_venue_values,
+                   multi_fields=('genres',), boolean_fields=('seeking_talent',),
+                   after_batch=sync_imported_genres(Venue))
+  elif kind == 'artists':
+    options = dict(table=Artist.__table__, form_class=ArtistForm, to_values=artist_values,
+                   multi_fields=('genres',), boolean_fields=('seeking_venue',),
+                   after_batch=sync_imported_genres(Artist))
+  else:
+    options = dict(table=Show.__table__, form_class=ShowForm, to_values=show_values,
+                   resolve=resolve_show_references, after_batch=touch_imported_shows)
+  importer = BulkImporter(
+    db.session,
+    batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+    use_copy=use_copy,
+    echo=lambda message: click.echo(message, err=True),
+    **options
+  )
+  stats = importer.run(read_rows(source, fmt))
+  click.echo('{read} rows read, {inserted} inserted, {rejected} rejected '
+             'in {seconds:.2f}s ({rows_per_second:.0f} rows/s)'.format(**stats))
+
+@app.cli.command('advance-shows')
+def advance_shows_command():
+  """Moves shows that have started from the upcoming to the past counters.
+
+  Meant to run every minute or so from cron; only venues and artists whose
+  next show has started are recounted.
+  """
+  now = datetime.now()
+  connection = db.session.connection()
+  venues = refresh_show_counters(connection, Venue, Show.venue_id, Venue.next_show_time <= now)
+  artists = refresh_show_counters(connection, Artist, Show.artist_id, Artist.next_show_time <= now)
+  db.session.commit()
+  click.echo('{} venues and {} artists recounted'.format(venues, artists))
+
+
+@app.cli.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True, help='Also place venues that already have a location.')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Venues updated per transaction.')
+def geocode_venues_command(everything, batch_size):
+  """Places venues on the map from their address.
+
+  The locations are written with Core updates, so the venue versions and
+  pages are left alone.
+  """
+  table = Venue.__table__
+  update = table.update().where(table.c.id == db.bindparam('venue_id')).values(
+    latitude=db.bindparam('lat'), longitude=db.bindparam('lon'), geohash=db.bindparam('hash'))
+  last_id, placed, missed = 0, 0, 0
+  while True:
+    query = db.session.query(Venue.id, Venue.address, Venue.city, Venue.state) \
+      .filter(Venue.id > last_id)
+    if not everything:
+      query = query.filter(Venue.geohash.is_(None))
+    rows = query.order_by(Venue.id).limit(batch_size).all()
+    if not rows:
+      break
+    values = []
+    for row in rows:
+      point = geocoder.geocode(row.address, row.city, row.state)
+      if point is None:
+        missed += 1
+        continue
+      values.append({"venue_id": row.id, "lat": point[0], "lon": point[1], "hash": venue_geohash(*point)})
+    if values:
+      db.session.execute(update, values)
+    db.session.commit()
+    placed += len(values)
+    last_id = rows[-1].id
+    click.echo('{} venues placed, {} not found'.format(placed, missed), err=True)
+  click.echo('{} venues placed, {} not found'.format(placed, missed))
+
+
+def purge_venue(venue_id, batch_size, echo):
+  # Deletes the shows of an archived venue batch_size at a time, each batch
+  # in a transaction of its own so no lock is held for long, then the venue.
+  # The show deletes skip the ORM events, so the counters and pages of the
+  # artists involved are refreshed per batch.
+  total = db.session.query(db.func.count(Show.id)).filter(Show.venue_id == venue_id).scalar()
+  deleted = 0
+  while True:
+    shows = db.session.query(Show.id, Show.artist_id) \
+      .filter(Show.venue_id == venue_id) \
+      .order_by(Show.id) \
+      .limit(batch_size) \
+      .all()
+    if not shows:
+      break
+    artist_ids = {show.artist_id for show in shows}
+    db.session.execute(Show.__table__.delete().where(Show.id.in_([show.id for show in shows])))
+    connection = db.session.connection()
+    refresh_show_counters(connection, Artist, Show.artist_id, Artist.id.in_(artist_ids))
+    connection.execute(Artist.__table__.update().where(Artist.id.in_(artist_ids)).values(updated_at=datetime.utcnow()))
+    db.session.commit()
+    deleted += len(shows)
+    purged_shows.inc(len(shows))
+    echo('venue {}: {} of {} shows deleted'.format(venue_id, deleted, total))
+  table = Venue.__table__
+  db.session.execute(table.delete().where(table.c.id == venue_id, table.c.archived_at.isnot(None)))
+  db.session.commit()
+  echo('venue {}: purged'.format(venue_id))
+  return deleted
+
+def start_purge(venue_id):
+  def run():
+    with app.app_context():
+      try:
+        purge_venue(venue_id, app.config['PURGE_BATCH_SIZE'], app.logger.info)
+      except Exception:
+        app.logger.exception('purge of venue %s failed; "flask purge-venues" resumes it', venue_id)
+  threading.Thread(target=run, name='purge-venue-{}'.format(venue_id), daemon=True).start()
+
+@app.cli.command('purge-venues')
+@click.option('--batch-size', type=int, help='Shows deleted per transaction (PURGE_BATCH_SIZE).')
+def purge_venues_command(batch_size):
+  """Deletes archived venues and their shows.
+
+  Picks up the purges that were interrupted, or all of them when
+  PURGE_IN_BACKGROUND is off and this runs from cron.
+  """
+  venue_ids = [row.id for row in db.session.query(Venue.id).filter(Venue.archived_at.isnot(None)).order_by(Venue.id)]
+  for venue_id in venue_ids:
+    purge_venue(venue_id, batch_size or app.config['PURGE_BATCH_SIZE'], lambda message: click.echo(message, err=True))
+  click.echo('{} venues purged'.format(len(venue_ids)))
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+  """Fingerprints and precompresses static/ into ASSETS_DIR.
+
+  Run on deploy; the app picks up the new manifest when it restarts.
+  """
+  stats = build_assets(app.static_folder, app.config['ASSETS_DIR'],
+                       gzip_level=app.config['ASSETS_GZIP_LEVEL'],
+                       brotli_quality=app.config['ASSETS_BROTLI_QUALITY'],
+                       echo=lambda message: click.echo(message, err=True))
+  click.echo('{files} assets, {bytes} bytes, {gzip_bytes} gzip bytes, {brotli_bytes} brotli bytes'.format(**stats))
+
 
 if not app.debug:
     file_handler = FileHandler('error.log')
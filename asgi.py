@@ -0,0 +1,13 @@
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+# Serves the whole app, the sync pages and forms as well as the async views
+# under /async, from an ASGI server:
+#
+#   uvicorn asgi:application --workers 4
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+
+application = WsgiToAsgi(app)
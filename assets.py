@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# Fingerprinted, precompressed static assets.
+#----------------------------------------------------------------------------#
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # .br variants are only built when brotli is installed
+    brotli = None
+
+MANIFEST = 'manifest.json'
+# formats that are compressed already gain nothing from gzip or brotli
+COMPRESSED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.ico', '.woff', '.woff2', '.gz', '.br', '.zip'}
+# content codings in order of preference, with the suffix of their files
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fingerprint(path, content):
+    """Returns path with a hash of content before its extension."""
+    root, extension = posixpath.splitext(path)
+    return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], extension)
+
+
+def rewrite_css(text, path, names):
+    """Points the relative url()s of the stylesheet at path to the
+    fingerprinted names of the files they refer to."""
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        if re.match(r'[a-z]+:|/', target):
+            return match.group(0)
+        name = names.get(posixpath.normpath(posixpath.join(directory, target)))
+        if name is None:
+            return match.group(0)
+        return 'url({0}{1}{2}{0})'.format(quote, posixpath.relpath(name, directory or '.'), suffix)
+    return CSS_URL.sub(replace, text)
+
+
+def build(source, target, gzip_level=9, brotli_quality=11, echo=print):
+    """Copies the files under source to target under fingerprinted names,
+    with .gz and .br variants where they are smaller, and writes the manifest
+    mapping every original path to its fingerprinted one.
+
+    Stylesheets are built last, as their url()s are rewritten to the
+    fingerprinted names, which changes their own hash.
+    """
+    source, target = os.path.abspath(source), os.path.abspath(target)
+    if source == target or source.startswith(target + os.sep):
+        raise ValueError('the assets must be built outside of {}'.format(source))
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    paths = []
+    for directory, subdirectories, files in os.walk(source):
+        subdirectories[:] = [name for name in subdirectories
+                             if os.path.join(directory, name) != target and not name.startswith('.')]
+        for name in files:
+            if not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(directory, name), source).replace(os.sep, '/'))
+    paths.sort(key=lambda path: (path.endswith('.css'), path))
+
+    names = {}
+    stats = {"files": 0, "bytes": 0, "gzip_bytes": 0, "brotli_bytes": 0}
+    for path in paths:
+        with open(os.path.join(source, path), 'rb') as asset:
+            content = asset.read()
+        if path.endswith('.css'):
+            content = rewrite_css(content.decode('utf-8'), path, names).encode('utf-8')
+        name = fingerprint(path, content)
+        variants = [('', content)]
+        if posixpath.splitext(path)[1].lower() not in COMPRESSED_EXTENSIONS:
+            # mtime=0 keeps the .gz files identical between builds
+            variants.append(('.gz', gzip.compress(content, compresslevel=gzip_level, mtime=0)))
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(content, quality=brotli_quality)))
+        os.makedirs(os.path.dirname(os.path.join(target, name)), exist_ok=True)
+        for suffix, data in variants:
+            if suffix and len(data) >= len(content):
+                continue
+            with open(os.path.join(target, name + suffix), 'wb') as output:
+                output.write(data)
+            stats[{'': 'bytes', '.gz': 'gzip_bytes', '.br': 'brotli_bytes'}[suffix]] += len(data)
+        names[path] = name
+        stats["files"] += 1
+    with open(os.path.join(target, MANIFEST), 'w', encoding='utf-8') as manifest:
+        json.dump(names, manifest, indent=2, sort_keys=True)
+    if brotli is None:
+        echo('brotli is not installed, only gzip variants were built')
+    return stats
+
+
+class AssetManifest(object):
+    """The fingerprinted names written by build() and their variants.
+
+    An empty manifest, before the first build, makes every asset fall back
+    to the static folder.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, MANIFEST), encoding='utf-8') as manifest:
+                self.names = json.load(manifest)
+        except FileNotFoundError:
+            self.names = {}
+        self.files = set(self.names.values())
+        # the variants are listed once, so serving one needs no stat calls
+        self.variants = set()
+        for directory_path, _, files in os.walk(directory):
+            for name in files:
+                self.variants.add(os.path.relpath(os.path.join(directory_path, name), directory).replace(os.sep, '/'))
+
+    def get(self, path):
+        """Returns the fingerprinted name of path, or None."""
+        return self.names.get(path)
+
+    def choose(self, name, accept_encodings):
+        """(file, content coding) to send for name, the coding being None for
+        the file itself. accept_encodings is the request's Accept-Encoding."""
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings[encoding] and name + suffix in self.variants:
+                return name + suffix, encoding
+        return name, None
@@ -0,0 +1,109 @@
+"""Compares the sync pages with their async variants under /async.
+
+Every read page is requested by --concurrency clients at once, first from
+the sync view and then from the async one, and throughput and p50/p99
+latency are reported side by side. The page data cache is cleared before
+every request so the detail pages reach the database. Requests go through
+the Flask test client in threads by default, or to a running server given
+with --base-url, e.g. one started with ``uvicorn asgi:application``.
+Run from the repository root against a database filled by seed.py:
+
+    python benchmarks/bench_async.py --database-url sqlite:////tmp/fyyur-bench.db
+"""
+import argparse
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_routes import percentile  # noqa: E402
+
+
+def page_cases(app_module):
+    """Returns ``(name, method, path, data)`` tuples of the pages with async variants."""
+    db, Venue, Artist = app_module.db, app_module.Venue, app_module.Artist
+    venue_id = db.session.query(Venue.id).order_by(Venue.upcoming_shows_count.desc(), Venue.id).limit(1).scalar()
+    artist_id = db.session.query(Artist.id).order_by(Artist.upcoming_shows_count.desc(), Artist.id).limit(1).scalar()
+    if venue_id is None or artist_id is None:
+        raise SystemExit('the database is empty, run benchmarks/seed.py first')
+    return [
+        ('venues listing', 'GET', '/venues', None),
+        ('venue detail', 'GET', '/venues/{}'.format(venue_id), None),
+        ('artist detail', 'GET', '/artists/{}'.format(artist_id), None),
+        ('shows listing', 'GET', '/shows', None),
+        ('venue search', 'POST', '/venues/search', {'search_term': 'blue'}),
+        ('artist search', 'POST', '/artists/search', {'search_term': 'blue'}),
+    ]
+
+
+def client_requester(app_module):
+    app = app_module.app
+
+    def request(method, path, data):
+        app_module.page_cache.clear()
+        response = app.test_client().open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+    return request
+
+
+def http_requester(base_url):
+    def request(method, path, data):
+        body = urllib.parse.urlencode(data).encode('ascii') if data else None
+        with urllib.request.urlopen(urllib.request.Request(base_url + path, data=body, method=method)) as response:
+            response.read()
+            return response.status
+    return request
+
+
+def run(request, method, path, data, concurrency, requests):
+    def timed(_):
+        started = time.perf_counter()
+        status = request(method, path, data)
+        return status, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    timings = [timing for _, timing in results]
+    errors = sum(1 for status, _ in results if status >= 400)
+    return requests / elapsed, percentile(timings, 0.50), percentile(timings, 0.99), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='database to benchmark, defaults to DATABASE_URL')
+    parser.add_argument('--base-url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=320, help='requests per page and variant')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SQL_PROFILE_SAMPLE_RATE', '0')
+
+    import app as app_module
+
+    app_module.app.config['WTF_CSRF_ENABLED'] = False
+    with app_module.app.app_context():
+        cases = page_cases(app_module)
+    request = http_requester(args.base_url.rstrip('/')) if args.base_url else client_requester(app_module)
+
+    print('{} concurrent clients, {} requests per row'.format(args.concurrency, args.requests))
+    print('{:<16} {:<6} {:>8} {:>9} {:>9} {:>7}'.format('page', 'path', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for name, method, path, data in cases:
+        for variant, prefix in (('sync', ''), ('async', '/async')):
+            throughput, p50, p99, errors = run(
+                request, method, prefix + path, data, args.concurrency, args.requests)
+            print('{:<16} {:<6} {:>8.1f} {:>9.2f} {:>9.2f} {:>7}'.format(
+                name, variant, throughput, p50, p99, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Micro-benchmark of the ``datetime`` template filter.
+
+Formats the show times of a venue page the way the templates do, with the
+original implementation (re-parse and re-compile on every call) and with
+app.format_datetime. Run from the repository root:
+
+    python benchmarks/bench_datetime_filter.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main(shows=500, distinct=50, repeat=5):
+    start = datetime(2026, 1, 1, 20, 0)
+    times = [start + timedelta(days=i % distinct) for i in range(shows)]
+    strings = [str(time) for time in times]
+
+    for value in strings[:distinct]:
+        assert format_datetime(value, 'full') == legacy_format_datetime(value, 'full')
+
+    cases = [
+        ('legacy, strings', lambda: [legacy_format_datetime(value, 'full') for value in strings]),
+        ('current, strings', lambda: [format_datetime(value, 'full') for value in strings]),
+        ('current, datetimes', lambda: [format_datetime(value, 'full') for value in times]),
+        ('current, uncached', lambda: [format_datetime.__wrapped__(value, 'full') for value in times]),
+    ]
+    print('{} show times ({} distinct), best of {}'.format(shows, distinct, repeat))
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        print('{:<20} {:8.2f} ms  {:6.2f} us/call'.format(name, best * 1000, best / shows * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Route benchmarks: latency, SQL statements and peak memory per route.
+
+Requests go through the Flask test client against the database at
+DATABASE_URL, normally one filled by benchmarks/seed.py. Each route is timed
+over --iterations requests after a warm-up; its statement count and the
+peak memory traced while serving it come from one extra request. The page
+data cache is cleared before every request unless --warm-cache is given.
+The create routes insert a row per request. Run from the repository root:
+
+    python benchmarks/bench_routes.py --database-url sqlite:////tmp/fyyur-bench.db \\
+        --output results.json --baseline baseline.json
+
+With --baseline, routes whose p50 or p99 grew by more than --tolerance, or
+that run more statements than in the baseline, are reported and the script
+exits with status 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# the shows inserted by the show create route
+SHOW_DURATION = timedelta(minutes=90)
+SHOW_GAP = timedelta(minutes=30)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def route_cases(app_module):
+    """Returns ``(name, method, url, data)`` tuples covering every page type.
+
+    data is the form to post, or a function of the request's index returning
+    it, for the routes that need a different form per request.
+    """
+    db, Venue, Artist, Show = app_module.db, app_module.Venue, app_module.Artist, app_module.Show
+    cases = []
+    busiest_ids = {}
+    for model, kind in ((Venue, 'venue'), (Artist, 'artist')):
+        total = model.upcoming_shows_count + model.past_shows_count
+        busiest = db.session.query(model.id).order_by(total.desc(), model.id).limit(1).scalar()
+        count = db.session.query(db.func.count(model.id)).scalar()
+        typical = db.session.query(model.id).order_by(total, model.id).offset(count // 2).limit(1).scalar()
+        if busiest is None:
+            raise SystemExit('the database has no {}s, run benchmarks/seed.py first'.format(kind))
+        cases += [
+            ('{} detail, busiest'.format(kind), 'GET', '/{}s/{}'.format(kind, busiest), None),
+            ('{} detail, typical'.format(kind), 'GET', '/{}s/{}'.format(kind, typical), None),
+            ('{} edit form'.format(kind), 'GET', '/{}s/{}/edit'.format(kind, typical), None),
+        ]
+        busiest_ids[kind] = busiest
+    # every show created books the busiest venue and artist, so each starts
+    # after the previous one, and after the shows of earlier runs, to pass
+    # the overlap checks
+    latest_end = db.session.query(db.func.max(Show.end_time)).filter(
+        db.or_(Show.venue_id == busiest_ids['venue'], Show.artist_id == busiest_ids['artist'])).scalar()
+    first_start = max(datetime.now() + timedelta(days=400), (latest_end or datetime.min) + SHOW_GAP)
+
+    def show_form(index):
+        start_time = first_start + index * (SHOW_DURATION + SHOW_GAP)
+        return {'venue_id': str(busiest_ids['venue']), 'artist_id': str(busiest_ids['artist']),
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'duration': str(SHOW_DURATION // timedelta(minutes=1))}
+
+    entity = {
+        'city': 'Benchmark City', 'state': 'CA', 'phone': '555-555-5555',
+        'genres': ['Jazz', 'Folk'], 'facebook_link': 'https://www.facebook.com/bench',
+        'website_link': 'https://bench.example.com', 'image_link': '',
+    }
+    cases += [
+        ('venues listing', 'GET', '/venues', None),
+        ('artists listing', 'GET', '/artists', None),
+        ('shows listing', 'GET', '/shows', None),
+        ('venue search', 'POST', '/venues/search', {'search_term': 'blue'}),
+        ('artist search', 'POST', '/artists/search', {'search_term': 'blue'}),
+        ('venues nearby, dense', 'GET', '/venues/nearby?lat=40.7128&lon=-74.0060', None),
+        ('venues nearby, sparse', 'GET', '/venues/nearby?lat=44.0&lon=-103.0&radius=500', None),
+        ('venue create form', 'GET', '/venues/create', None),
+        ('artist create form', 'GET', '/artists/create', None),
+        ('show create form', 'GET', '/shows/create', None),
+        ('venue create', 'POST', '/venues/create',
+         dict(entity, name='Benchmark Venue', address='1 Benchmark Road')),
+        ('artist create', 'POST', '/artists/create', dict(entity, name='Benchmark Artist')),
+        ('show create', 'POST', '/shows/create', show_form),
+        ('api venues', 'GET', '/api/v1/venues', None),
+        ('api shows', 'GET', '/api/v1/shows', None),
+    ]
+    return cases
+
+
+def run_case(app_module, client, case, iterations, warmup, warm_cache):
+    from profiling import count_statements
+
+    name, method, url, data = case
+    requests = itertools.count()
+
+    def request():
+        if not warm_cache:
+            app_module.page_cache.clear()
+        index = next(requests)
+        response = client.open(url, method=method, data=data(index) if callable(data) else data)
+        response.get_data()
+        return response.status_code
+
+    for _ in range(warmup):
+        request()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        status = request()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    with count_statements() as statements:
+        request()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "method": method,
+        "url": url,
+        "status": status,
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "queries": statements.count,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change from baseline and returns the regressed route names."""
+    regressions = []
+    print()
+    print('{:<24} {:>9} {:>9} {:>9}'.format('vs baseline', 'p50', 'p99', 'queries'))
+    for name, current in results['routes'].items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        changes = [current[key] / previous[key] - 1 if previous[key] else 0.0
+                   for key in ('p50_ms', 'p99_ms')]
+        queries = current['queries'] - previous['queries']
+        regressed = any(change > tolerance for change in changes) or queries > 0
+        if regressed:
+            regressions.append(name)
+        print('{:<24} {:>+8.0%} {:>+8.0%} {:>+9d}{}'.format(
+            name, changes[0], changes[1], queries, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='database to benchmark, defaults to DATABASE_URL')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='keep the page data cache between requests')
+    parser.add_argument('--route', action='append', default=[],
+                        help='only run routes whose name contains this text')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed latency growth over the baseline, default 0.10')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    os.environ['DATABASE_URL'] = args.database_url
+    # the benchmarks measure the routes, not the sampled request profiling
+    os.environ.setdefault('SQL_PROFILE_SAMPLE_RATE', '0')
+
+    import app as app_module
+
+    app = app_module.app
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    with app.app_context():
+        cases = route_cases(app_module)
+    if args.route:
+        cases = [case for case in cases if any(text in case[0] for text in args.route)]
+
+    results = {
+        "meta": {
+            "database": app_module.db.engine.dialect.name,
+            "python": platform.python_version(),
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "iterations": args.iterations,
+            "warm_cache": args.warm_cache,
+        },
+        "routes": {},
+    }
+    print('{:<24} {:>6} {:>9} {:>9} {:>8} {:>10}'.format('route', 'status', 'p50 ms', 'p99 ms', 'queries', 'peak KiB'))
+    for case in cases:
+        result = run_case(app_module, client, case, args.iterations, args.warmup, args.warm_cache)
+        results['routes'][case[0]] = result
+        print('{:<24} {:>6} {:>9.2f} {:>9.2f} {:>8} {:>10.1f}'.format(
+            case[0], result['status'], result['p50_ms'], result['p99_ms'], result['queries'], result['peak_kib']))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Fills a database with a synthetic dataset for the route benchmarks.
+
+Shows are spread over venues and artists with a Zipf-like skew, so a few
+venues and artists have thousands of shows while most have a handful, and
+venues cluster in a few large cities. The tables are dropped and created
+from the models, then filled with Core inserts; the show counters and genre
+links the ORM events would maintain are computed here. Run from the
+repository root:
+
+    python benchmarks/seed.py --database-url sqlite:////tmp/fyyur-bench.db
+    python benchmarks/seed.py --database-url postgresql://localhost/fyyur_bench \\
+        --venues 10000 --artists 50000 --shows 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Jose', 'CA'), ('Austin', 'TX'), ('Jacksonville', 'FL'),
+    ('Columbus', 'OH'), ('Charlotte', 'NC'), ('San Francisco', 'CA'), ('Indianapolis', 'IN'),
+    ('Seattle', 'WA'), ('Denver', 'CO'), ('Washington', 'DC'), ('Boston', 'MA'),
+    ('Nashville', 'TN'), ('Detroit', 'MI'), ('Portland', 'OR'), ('Las Vegas', 'NV'),
+    ('Memphis', 'TN'), ('Louisville', 'KY'), ('Baltimore', 'MD'), ('Milwaukee', 'WI'),
+    ('Albuquerque', 'NM'), ('Tucson', 'AZ'), ('Fresno', 'CA'), ('Atlanta', 'GA'),
+    ('Miami', 'FL'), ('Minneapolis', 'MN'), ('New Orleans', 'LA'), ('Cleveland', 'OH'),
+]
+WORDS = [
+    'Blue', 'Golden', 'Velvet', 'Electric', 'Silver', 'Midnight', 'Crimson', 'Hidden',
+    'Lucky', 'Royal', 'Rusty', 'Wild', 'Neon', 'Copper', 'Paper', 'Echo',
+]
+NOUNS = ['Room', 'Hall', 'Tavern', 'Lounge', 'Garage', 'Club', 'Theatre', 'Cellar', 'Barn', 'Loft']
+BANDS = ['Wolves', 'Pilots', 'Sisters', 'Machines', 'Kings', 'Strangers', 'Ghosts', 'Rivers']
+CHUNK = 10000
+# Shows are not checked for booking conflicts, hot venues will have overlaps
+SHOW_DURATION = timedelta(hours=2)
+
+
+def skewed_weights(count, skew, rng):
+    """Returns cumulative Zipf-like weights over count ids in random order."""
+    weights = [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def entity_rows(kind, count, genres, rng, place=None):
+    city_weights = skewed_weights(len(CITIES), 1.0, rng)
+    for index in range(1, count + 1):
+        city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+        if kind == 'venue':
+            name = '{} {} {}'.format(rng.choice(WORDS), rng.choice(NOUNS), index)
+        else:
+            name = 'The {} {} {}'.format(rng.choice(WORDS), rng.choice(BANDS), index)
+        row = {
+            "id": index,
+            "name": name,
+            "city": city,
+            "state": state,
+            "phone": '555-{:03d}-{:04d}'.format(rng.randrange(1000), rng.randrange(10000)),
+            "genres": ','.join(rng.sample(genres, rng.randint(1, 3))),
+            "image_link": 'https://images.example.com/{}/{}.jpg'.format(kind, index),
+            "facebook_link": 'https://www.facebook.com/{}{}'.format(kind, index),
+            "website_link": 'https://{}{}.example.com'.format(kind, index),
+            "seeking_description": None,
+        }
+        if kind == 'venue':
+            row.update(address='{} Main Street'.format(rng.randrange(1, 9999)),
+                       seeking_talent=rng.random() < 0.3)
+            row.update(place(city, state))
+        else:
+            row.update(seeking_venue=rng.random() < 0.3)
+        yield row
+
+
+def insert(connection, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            connection.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(table.insert(), chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='database to fill, defaults to DATABASE_URL')
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=2000000)
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent of the shows per venue and per artist')
+    parser.add_argument('--past-days', type=int, default=730)
+    parser.add_argument('--future-days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import app, db, Venue, Artist, Show, sync_genres, venue_geohash
+    from geo import FileGeocoder
+    from forms import VenueForm
+
+    rng = random.Random(args.seed)
+    genres = [name for name, _ in VenueForm.genres.kwargs['choices']]
+    started = time.perf_counter()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        connection = db.session.connection()
+
+        places = FileGeocoder(app.config['GEOCODER_FILE'])
+
+        def place(city, state):
+            # scattered around the city centre, most within about 20 km
+            latitude, longitude = places.geocode('', city, state)
+            latitude, longitude = latitude + rng.gauss(0, 0.1), longitude + rng.gauss(0, 0.1)
+            return {"latitude": latitude, "longitude": longitude,
+                    "geohash": venue_geohash(latitude, longitude)}
+
+        insert(connection, Venue.__table__, entity_rows('venue', args.venues, genres, rng, place))
+        insert(connection, Artist.__table__, entity_rows('artist', args.artists, genres, rng))
+        sync_genres(connection, Venue, db.true())
+        sync_genres(connection, Artist, db.true())
+        print('{} venues and {} artists'.format(args.venues, args.artists))
+
+        now = datetime.now().replace(second=0, microsecond=0)
+        first = now - timedelta(days=args.past_days)
+        span = (args.past_days + args.future_days) * 24 * 4
+        venue_ids = range(1, args.venues + 1)
+        artist_ids = range(1, args.artists + 1)
+        venue_weights = skewed_weights(args.venues, args.skew, rng)
+        artist_weights = skewed_weights(args.artists, args.skew, rng)
+        counters = {
+            Venue: [[0, 0, None] for _ in range(args.venues + 1)],
+            Artist: [[0, 0, None] for _ in range(args.artists + 1)],
+        }
+
+        def show_rows():
+            for offset in range(0, args.shows, CHUNK):
+                size = min(CHUNK, args.shows - offset)
+                venues = rng.choices(venue_ids, cum_weights=venue_weights, k=size)
+                artists = rng.choices(artist_ids, cum_weights=artist_weights, k=size)
+                for venue_id, artist_id in zip(venues, artists):
+                    # start times fall on quarter hours
+                    start_time = first + timedelta(minutes=15 * rng.randrange(span))
+                    for counter in (counters[Venue][venue_id], counters[Artist][artist_id]):
+                        if start_time > now:
+                            counter[0] += 1
+                            if counter[2] is None or start_time < counter[2]:
+                                counter[2] = start_time
+                        else:
+                            counter[1] += 1
+                    yield {"venue_id": venue_id, "artist_id": artist_id,
+                           "start_time": start_time, "end_time": start_time + SHOW_DURATION}
+                print('{} shows'.format(offset + size), end='\r', flush=True)
+
+        insert(connection, Show.__table__, show_rows())
+        print()
+
+        for model, values in counters.items():
+            table = model.__table__
+            statement = table.update().where(table.c.id == db.bindparam('entity_id')).values(
+                upcoming_shows_count=db.bindparam('upcoming'),
+                past_shows_count=db.bindparam('past'),
+                next_show_time=db.bindparam('next_show'),
+            )
+            rows = [
+                {"entity_id": entity_id, "upcoming": upcoming, "past": past, "next_show": next_show}
+                for entity_id, (upcoming, past, next_show) in enumerate(values) if upcoming or past
+            ]
+            for offset in range(0, len(rows), CHUNK):
+                connection.execute(statement, rows[offset:offset + CHUNK])
+
+        if db.engine.dialect.name == 'postgresql':
+            # explicit ids leave the sequences behind
+            for table in (Venue.__table__, Artist.__table__):
+                connection.execute(db.text(
+                    "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), max(id)) FROM \"{0}\"".format(table.name)))
+        db.session.commit()
+
+    print('seeded in {:.1f} s'.format(time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
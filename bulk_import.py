@@ -0,0 +1,189 @@
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#----------------------------------------------------------------------------#
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n', 'off')
+
+
+class RowError(ValueError):
+    """A line that could not be read as a row, yielded in its place."""
+
+
+def read_rows(stream, fmt):
+    """Yields ``(line_number, row)`` pairs from a CSV or JSON Lines stream.
+
+    A JSON line that does not parse to an object is yielded as a RowError,
+    so the importer rejects it and goes on with the next line.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = RowError('invalid JSON: {}'.format(error))
+            else:
+                if not isinstance(row, dict):
+                    row = RowError('expected a JSON object, got {}'.format(type(row).__name__))
+            yield line_number, row
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_formdata(row, multi_fields=(), boolean_fields=()):
+    """Converts a CSV or JSON row into form data for the WTForms forms.
+
+    Multi-valued fields may be JSON lists or comma separated strings.
+    """
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key in multi_fields and isinstance(value, str):
+            value = [item.strip() for item in value.split(',') if item.strip()]
+        if key in boolean_fields:
+            value = '' if str(value).strip().lower() in FALSE_VALUES else 'y'
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(key, str(item))
+        else:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def _copy_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        value = value.isoformat(' ')
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class BulkImporter(object):
+    """Validates rows with a form and inserts them in batches.
+
+    Rows failing validation, or rejected by resolve(), are reported through
+    echo and counted but never kept, so memory use only depends on the batch
+    size. Each batch is committed on its own; when the database rejects a
+    batch it is retried row by row to single out the bad rows.
+    """
+
+    def __init__(self, session, table, form_class, to_values, batch_size=1000,
+                 use_copy=False, resolve=None, after_batch=None,
+                 multi_fields=(), boolean_fields=(), echo=print):
+        self.session = session
+        self.table = table
+        self.form_class = form_class
+        self.to_values = to_values
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.resolve = resolve
+        self.after_batch = after_batch
+        self.multi_fields = multi_fields
+        self.boolean_fields = boolean_fields
+        self.echo = echo
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+
+    def reject(self, line_number, errors):
+        self.rejected += 1
+        if isinstance(errors, dict):
+            errors = '; '.join('{}: {}'.format(field, ', '.join(messages))
+                               for field, messages in errors.items())
+        self.echo('line {}: {}'.format(line_number, errors))
+
+    def run(self, rows):
+        started = time.perf_counter()
+        for batch in batched(rows, self.batch_size):
+            valid = []
+            for line_number, row in batch:
+                self.read += 1
+                if isinstance(row, RowError):
+                    self.reject(line_number, str(row))
+                    continue
+                form = self.form_class(
+                    formdata=to_formdata(row, self.multi_fields, self.boolean_fields),
+                    meta={'csrf': False})
+                if form.validate():
+                    valid.append((line_number, self.to_values(form)))
+                else:
+                    self.reject(line_number, form.errors)
+            if self.resolve is not None and valid:
+                valid = self.resolve(valid, self.reject)
+            if valid:
+                self._insert_batch(valid)
+        elapsed = time.perf_counter() - started
+        return {
+            "read": self.read,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "seconds": elapsed,
+            "rows_per_second": self.read / elapsed if elapsed else 0.0,
+        }
+
+    def _insert_batch(self, valid):
+        values = [row for _, row in valid]
+        try:
+            self._insert(values)
+            self.session.commit()
+        except DBAPIError:
+            self.session.rollback()
+            values = []
+            for line_number, row in valid:
+                try:
+                    self._insert([row])
+                    self.session.commit()
+                    values.append(row)
+                except DBAPIError as error:
+                    self.session.rollback()
+                    self.reject(line_number, str(error.orig))
+        self.inserted += len(values)
+        if self.after_batch is not None and values:
+            self.after_batch(values)
+            self.session.commit()
+
+    def _insert(self, values):
+        if not self.use_copy:
+            self.session.execute(self.table.insert(), values)
+            return
+        # COPY only sends the given columns, so column defaults are applied
+        # here the way an INSERT through SQLAlchemy would
+        columns = [column for column in self.table.columns if not column.primary_key]
+        buffer = io.StringIO()
+        for row in values:
+            cells = []
+            for column in columns:
+                value = row.get(column.name)
+                if value is None and column.default is not None:
+                    default = column.default.arg
+                    value = default(None) if callable(default) else default
+                cells.append(_copy_value(value))
+            buffer.write(','.join(cells) + '\n')
+        buffer.seek(0)
+        cursor = self.session.connection().connection.cursor()
+        cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            self.table.name, ', '.join('"{}"'.format(column.name) for column in columns)), buffer)
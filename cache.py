@@ -0,0 +1,149 @@
+#----------------------------------------------------------------------------#
+# Page data cache.
+#----------------------------------------------------------------------------#
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # the redis backend is optional
+    redis = None
+
+
+class MemoryBackend(object):
+    """In-process LRU store bounded by the total size of the stored values.
+
+    on_discard, when given, is called with every key that leaves the store.
+    """
+
+    def __init__(self, max_bytes, on_discard=None):
+        self.max_bytes = max_bytes
+        self.on_discard = on_discard
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, expires_at)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            if self.on_discard is not None:
+                for key in self._entries:
+                    self.on_discard(key)
+            self._entries.clear()
+            self.size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+            if self.on_discard is not None:
+                self.on_discard(key)
+
+
+class RedisBackend(object):
+    """Store in a Redis-compatible server shared by all worker processes.
+
+    Eviction under memory pressure is left to the server's maxmemory policy
+    (allkeys-lru is the natural choice).
+    """
+
+    def __init__(self, url, prefix='fyyur:page:'):
+        if redis is None:
+            raise RuntimeError('PAGE_CACHE_BACKEND = "redis" requires the redis package '
+                               '(pip install -r requirements.txt)')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, expires_at):
+        ttl = None
+        if expires_at is not None:
+            ttl = int((expires_at - time.time()) * 1000)
+            if ttl <= 0:
+                return
+        self.client.set(self.prefix + key, value, px=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class PageCache(object):
+    """JSON-serialized page data keyed by entity and version, with hit/miss
+    counters. A change gives the entity a new key, so entries are never
+    invalidated: the ones of old versions are evicted like any other.
+
+    Every entry lives at most ttl seconds, and less when set() is given an
+    earlier expiry.
+    """
+
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        if config['PAGE_CACHE_BACKEND'] == 'redis':
+            backend = RedisBackend(config['PAGE_CACHE_REDIS_URL'])
+        else:
+            backend = MemoryBackend(config['PAGE_CACHE_MAX_BYTES'])
+        return cls(backend, ttl=config['PAGE_CACHE_TTL'])
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, data, expires_at=None):
+        if self.ttl is not None:
+            deadline = time.time() + self.ttl
+            expires_at = deadline if expires_at is None else min(expires_at, deadline)
+        self.backend.set(key, json.dumps(data).encode('utf-8'), expires_at)
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
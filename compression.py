@@ -0,0 +1,181 @@
+#----------------------------------------------------------------------------#
+# On the fly response compression.
+#----------------------------------------------------------------------------#
+import itertools
+import time
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # responses are only gzipped without brotli
+    brotli = None
+
+# images, fonts, archives and the like are compressed already, so only these
+# types are compressed
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+# server-sent events must reach the client as they are written
+STREAMED_TYPES = {'text/event-stream'}
+
+
+def compressible(content_type):
+    mimetype = content_type.split(';')[0].strip().lower()
+    if mimetype in STREAMED_TYPES:
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES or \
+        mimetype.endswith('+json') or mimetype.endswith('+xml')
+
+
+class GzipEncoder(object):
+
+    def __init__(self, level):
+        # wbits 31 writes the gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(object):
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(object):
+    """WSGI middleware compressing responses with brotli or gzip, whichever
+    the client prefers.
+
+    Bodies are compressed chunk by chunk as the app yields them, so streamed
+    templates stay streamed: the compressed output is flushed to the client
+    every flush_size bytes of input. Responses of a type that is not
+    compressible, already encoded, marked no-transform, or shorter than
+    min_size are sent as they are. A body of unknown length is held back
+    until it reaches min_size, or ends.
+
+    observe, when given, is called with the WSGI environ, the encoding, the
+    sizes before and after compression and the CPU seconds spent on it, once
+    each compressed response is sent.
+    """
+
+    def __init__(self, app, level=6, brotli_quality=4, min_size=1024, flush_size=8192, observe=None):
+        self.app = app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self.flush_size = flush_size
+        self.observe = observe
+
+    def negotiate(self, environ):
+        """The encoding to compress the response with, or None."""
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.level)
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+        started = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            # the response is started by compress(), once the headers and
+            # enough of the body show whether to compress it
+            started[:] = [status, headers, exc_info]
+            return written.append
+
+        return self.compress(environ, self.app(environ, capture), encoding, started, written, start_response)
+
+    def should_compress(self, status, headers):
+        headers = Headers(headers)
+        return not (status[:3] in ('204', '206', '304') or
+                    'Content-Encoding' in headers or
+                    'no-transform' in headers.get('Cache-Control', '') or
+                    not compressible(headers.get('Content-Type', '')) or
+                    headers.get('Content-Length', type=int, default=self.min_size) < self.min_size)
+
+    def compress(self, environ, body, encoding, started, written, start_response):
+        try:
+            chunks = iter(body)
+            pending = list(written)
+            if not started:
+                # the app may start the response with its first chunk
+                pending.extend(itertools.islice(chunks, 1))
+            status, headers, exc_info = started
+            if not self.should_compress(status, headers):
+                start_response(status, headers, exc_info)
+                yield from pending
+                yield from chunks
+                return
+            # holds the body back while its length may still be under min_size
+            size = sum(map(len, pending))
+            while size < self.min_size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    start_response(status, headers, exc_info)
+                    yield from pending
+                    return
+                pending.append(chunk)
+                size += len(chunk)
+
+            headers = Headers(headers)
+            headers.remove('Content-Length')
+            headers['Content-Encoding'] = encoding
+            headers.add('Vary', 'Accept-Encoding')
+            etag = headers.get('ETag')
+            if etag and not etag.startswith('W/'):
+                # the compressed body is not byte for byte the one the ETag names
+                headers['ETag'] = 'W/' + etag
+            start_response(status, headers.to_wsgi_list(), exc_info)
+
+            encoder = self.encoder(encoding)
+            raw = compressed = unflushed = 0
+            seconds = 0.0
+            for data in itertools.chain(pending, chunks):
+                started_at = time.thread_time()
+                output = encoder.process(data)
+                unflushed += len(data)
+                if unflushed >= self.flush_size:
+                    output += encoder.flush()
+                    unflushed = 0
+                seconds += time.thread_time() - started_at
+                raw += len(data)
+                compressed += len(output)
+                if output:
+                    yield output
+            started_at = time.thread_time()
+            output = encoder.finish()
+            seconds += time.thread_time() - started_at
+            compressed += len(output)
+            yield output
+            if self.observe is not None:
+                self.observe(environ, encoding, raw, compressed, seconds)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
@@ -10,4 +10,117 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres:<password>@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres:<password>@localhost:5432/fyyur')
+
+# Connection pool. The sizes and timeouts apply to client/server databases;
+# SQLite keeps SQLAlchemy's own pool and only uses DB_POOL_PRE_PING.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Seconds after which a connection is replaced, -1 to keep it forever
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Checks each connection on checkout so ones dropped by a database restart
+# are replaced instead of failing the request
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no')
+# PostgreSQL statement_timeout in milliseconds, 0 for no limit
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
+# Read replicas, as a comma separated list of database URLs. GET requests
+# read from a replica; writes and everything else use the database above.
+REPLICA_DATABASE_URLS = [url for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if url]
+# Seconds after submitting a change during which a user reads from the
+# primary, so replica lag does not hide their own change
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+# Replicas further behind than this many seconds are taken out of use
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+# Seconds between replica health checks
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+
+# Database of the async views under /async. Defaults to the database above
+# through asyncpg (PostgreSQL) or aiosqlite (SQLite).
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+
+# Number of city/state areas shown per page on the venues listing
+AREAS_PER_PAGE = 20
+
+# Seconds after which the in-memory search indexes are rebuilt from the
+# database, so writes handled by other worker processes become searchable
+SEARCH_INDEX_MAX_AGE = 300
+
+# Number of shows per page on the shows listing
+SHOWS_PER_PAGE = 30
+
+# Shows read, and events written, at a time by the .ics calendar feeds
+CALENDAR_BATCH_SIZE = 500
+
+# Cache for the data behind the venue and artist pages. The "memory" backend
+# is local to each worker process; "redis" shares entries through a
+# Redis-compatible server at PAGE_CACHE_REDIS_URL.
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Upper bound on the lifetime of an entry, in seconds
+PAGE_CACHE_TTL = 300
+
+# Rendered fragments of the venue and show listings, kept in memory up to
+# FRAGMENT_CACHE_MAX_BYTES in total and FRAGMENT_CACHE_TTL seconds each
+FRAGMENT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+FRAGMENT_CACHE_TTL = 3600
+
+# Default and maximum number of rows returned by one JSON API request
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Geocoder placing venues from their address: "file" reads GEOCODER_FILE,
+# "none" leaves venues unplaced, and "module:factory" plugs in a service
+GEOCODER = os.environ.get('GEOCODER', 'file')
+GEOCODER_FILE = os.environ.get('GEOCODER_FILE', os.path.join(basedir, 'data', 'places.csv'))
+# Characters of the geohash stored for each venue, about 5 m at 9
+GEOHASH_PRECISION = 9
+
+# Default and maximum radius in km, and default and maximum number of
+# venues, of the nearby venues search
+NEARBY_RADIUS_KM = 25
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+
+# Rows validated and inserted per transaction by "flask import"
+IMPORT_BATCH_SIZE = 1000
+
+# Deleted venues are hidden at once and their shows deleted this many per
+# transaction, by a background thread or else by "flask purge-venues"
+PURGE_BATCH_SIZE = 1000
+PURGE_IN_BACKGROUND = os.environ.get('PURGE_IN_BACKGROUND', '1').lower() not in ('0', 'false', 'no')
+
+# Pages of the other side touched by the edit of a venue or artist name, in
+# the request and then this many per transaction by a background thread
+LINKED_PAGES_BATCH_SIZE = 500
+
+# Number of formatted show times memoized by the datetime template filter
+DATETIME_FILTER_CACHE_SIZE = 4096
+
+# Fingerprinted and precompressed copies of static/, built by
+# "flask build-assets" and cached by browsers for ASSETS_MAX_AGE seconds
+ASSETS_DIR = os.environ.get('ASSETS_DIR', os.path.join(basedir, 'build', 'assets'))
+ASSETS_MAX_AGE = 365 * 24 * 3600
+ASSETS_GZIP_LEVEL = 9
+ASSETS_BROTLI_QUALITY = 11
+
+# Compress responses on the fly, with brotli when it is installed and the
+# client accepts it and gzip otherwise. Bodies shorter than
+# COMPRESSION_MIN_SIZE are sent as they are; streamed ones are flushed every
+# COMPRESSION_FLUSH_SIZE bytes.
+COMPRESSION = os.environ.get('COMPRESSION', '0').lower() not in ('0', 'false', 'no')
+COMPRESSION_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_FLUSH_SIZE = 8192
+
+# Share of requests whose SQL statements are also counted by normalized text,
+# reported in a Server-Timing header and logged
+SQL_PROFILE_SAMPLE_RATE = float(os.environ.get('SQL_PROFILE_SAMPLE_RATE', 1.0 if DEBUG else 0.01))
+# A normalized statement run more often than this in one profiled request is
+# logged as a likely N+1 query
+SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
@@ -1,7 +1,11 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange
+
+# Longest show accepted, in minutes. Booking conflicts are searched among the
+# shows starting at most this long before a new show.
+MAX_SHOW_DURATION = 12 * 60
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +19,11 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=MAX_SHOW_DURATION)],
+        default=120
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# Template fragment cache.
+#----------------------------------------------------------------------------#
+import threading
+import time
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import MemoryBackend
+
+
+def fragment_key(key):
+    """(cache key, entity tags) of the key given to {% cache %}.
+
+    The key is a sequence of parts. A (kind, id, version) tuple names an
+    entity the fragment shows: the fragment is keyed by its version and
+    tagged "kind:id", like "venue:1". Lists
+    of such tuples are expanded; any other part is used as it is.
+    """
+    parts, tags = [], []
+
+    def add(part):
+        if isinstance(part, tuple) and len(part) == 3:
+            kind, entity_id, version = part
+            tag = '{}:{}'.format(kind, entity_id)
+            tags.append(tag)
+            parts.append('{}@{}'.format(tag, version))
+        elif isinstance(part, list):
+            for item in part:
+                add(item)
+        else:
+            parts.append(str(part))
+    for part in ([key] if isinstance(key, str) else key):
+        add(part)
+    return '|'.join(parts), tags
+
+
+class FragmentCache(object):
+    """Rendered fragments in an LRU bounded by their total size, indexed by
+    the entities they show so a change to one drops its fragments at once.
+
+    Fragments keyed by version are never served stale, the index only frees
+    their memory early.
+    """
+
+    def __init__(self, max_bytes):
+        self.backend = MemoryBackend(max_bytes, on_discard=self._forget)
+        self.hits = 0
+        self.misses = 0
+        self._keys = {}
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def set(self, key, fragment, tags=(), ttl=None):
+        value = fragment.encode('utf-8')
+        if len(value) > self.backend.max_bytes:
+            return
+        self.backend.set(key, value, None if ttl is None else time.time() + ttl)
+        with self._lock:
+            self._keys[key] = tags
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, *tags):
+        """Drops the fragments showing the entities tagged, like "venue:1"."""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.pop(tag, ()))
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def _forget(self, key):
+        with self._lock:
+            for tag in self._keys.pop(key, ()):
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, ttl %}...{% endcache %} renders its body once and then
+    serves it from environment.fragment_cache, for ttl seconds or until
+    invalidated. ttl may be left out or none to keep the fragment until it
+    is evicted. See fragment_key() for the key.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key, tags = fragment_key(key)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment, tags, ttl)
+        return Markup(fragment)
@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Geocoding and geohash search.
+#----------------------------------------------------------------------------#
+import csv
+import importlib
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision):
+    """Returns the geohash of a point, precision characters long."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of the cells of a geohash precision."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def prefix_range(prefix):
+    """(low, high) bounds of the geohashes starting with prefix, for an index
+    range scan; high is None past the last cell."""
+    chars = list(prefix)
+    while chars and chars[-1] == BASE32[-1]:
+        chars.pop()
+    if not chars:
+        return prefix, None
+    chars[-1] = BASE32[BASE32.index(chars[-1]) + 1]
+    return prefix, ''.join(chars)
+
+
+def covering_ranges(latitude, longitude, radius_km, finest, max_cells=64):
+    """(low, high) geohash ranges covering every point within radius_km.
+
+    The cells overlapping the bounding box of the circle are taken at the
+    finest precision, up to finest, that needs at most max_cells of them.
+    Cells next to each other in geohash order are merged into one range.
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+    # the box is widest at its edge nearest to a pole
+    widest = math.cos(math.radians(max(abs(south), abs(north))))
+    d_lon = d_lat / widest if widest > 1e-9 else 180.0
+    for precision in range(finest, 0, -1):
+        height, width = cell_size(precision)
+        rows = round(180 / height)
+        columns = round(360 / width)
+        first_row = math.floor((south + 90) / height)
+        last_row = min(math.floor((north + 90) / height), rows - 1)
+        if d_lon >= 180:
+            first_column, last_column = 0, columns - 1
+        else:
+            first_column = math.floor((longitude - d_lon + 180) / width)
+            last_column = min(math.floor((longitude + d_lon + 180) / width), first_column + columns - 1)
+        if (last_row - first_row + 1) * (last_column - first_column + 1) <= max_cells:
+            break
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        for column in range(first_column, last_column + 1):
+            # columns past the antimeridian wrap around
+            cells.add(encode((row + 0.5) * height - 90, (column % columns + 0.5) * width - 180, precision))
+    ranges = []
+    for cell in sorted(cells):
+        low, high = prefix_range(cell)
+        if ranges and ranges[-1][1] == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _key(*parts):
+    return tuple(' '.join((part or '').lower().split()) for part in parts)
+
+
+class FileGeocoder(object):
+    """Geocoder reading places from a CSV file with address, city, state,
+    latitude and longitude columns.
+
+    Addresses not in the file fall back to the row of their city that has
+    an empty address, so a file of city centres places every venue in its
+    city.
+    """
+
+    def __init__(self, path):
+        self.places = {}
+        with open(path, newline='', encoding='utf-8') as source:
+            for row in csv.DictReader(source):
+                point = (float(row['latitude']), float(row['longitude']))
+                self.places[_key(row['address'], row['city'], row['state'])] = point
+
+    def geocode(self, address, city, state):
+        """Returns (latitude, longitude) of an address, or None."""
+        return self.places.get(_key(address, city, state)) or self.places.get(_key('', city, state))
+
+
+class NullGeocoder(object):
+    """Geocoder that places nothing, for GEOCODER = "none"."""
+
+    def geocode(self, address, city, state):
+        return None
+
+
+def geocoder_from_config(config):
+    """The geocoder named by GEOCODER: "file", "none", or "module:factory" for
+    a factory called with the config and returning an object with a
+    geocode(address, city, state) method."""
+    name = config['GEOCODER']
+    if name == 'file':
+        return FileGeocoder(config['GEOCODER_FILE'])
+    if name == 'none':
+        return NullGeocoder()
+    module, _, factory = name.partition(':')
+    return getattr(importlib.import_module(module), factory)(config)
@@ -0,0 +1,52 @@
+"""cascade show deletes and archive venues
+
+Revision ID: 00d6f036fb1c
+Revises: afee20f59374
+Create Date: 2026-10-18 18:40:52.603117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '00d6f036fb1c'
+down_revision = 'afee20f59374'
+branch_labels = None
+depends_on = None
+
+REFERENCES = (('venue_id', 'Venue'), ('artist_id', 'Artist'))
+# the foreign keys of the first migration are unnamed; SQLite's are found
+# through this convention
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def replace_foreign_keys(ondelete):
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('Show', recreate='always', naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in REFERENCES:
+                name = 'fk_Show_{}_{}'.format(column, referred)
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+        return
+
+    # added NOT VALID and validated afterwards, so the table is only locked
+    # against writes while the constraints are swapped
+    for column, referred in REFERENCES:
+        name = 'Show_{}_fkey'.format(column)
+        op.execute('''
+            ALTER TABLE "Show" DROP CONSTRAINT "{name}",
+            ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) REFERENCES "{referred}" (id){ondelete} NOT VALID
+        '''.format(name=name, column=column, referred=referred,
+                   ondelete=' ON DELETE ' + ondelete if ondelete else ''))
+        op.execute('ALTER TABLE "Show" VALIDATE CONSTRAINT "{}"'.format(name))
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
+    op.drop_column('Venue', 'archived_at')
@@ -0,0 +1,63 @@
+"""add show end time
+
+Revision ID: 17ec9133919a
+Revises: 92bd2e762e7b
+Create Date: 2026-10-18 14:05:37.520914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '17ec9133919a'
+down_revision = '92bd2e762e7b'
+branch_labels = None
+depends_on = None
+
+# existing shows are given the default duration of the show form
+DEFAULT_DURATION_MINUTES = 120
+BOOKINGS = (('venue_id', 'ex_Show_venue_id_period'), ('artist_id', 'ex_Show_artist_id_period'))
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite cannot add a column with a non-constant default
+        op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=False,
+                                        server_default=sa.text("'1970-01-01 00:00:00'")))
+        # in the format SQLAlchemy stores, so times compare as strings
+        op.execute("UPDATE \"Show\" SET end_time = "
+                   "strftime('%Y-%m-%d %H:%M:%f', start_time, '+{} minutes') || '000'".format(
+                       DEFAULT_DURATION_MINUTES))
+        return
+
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute("UPDATE \"Show\" SET end_time = start_time + interval '{} minutes'".format(
+        DEFAULT_DURATION_MINUTES))
+    op.alter_column('Show', 'end_time', nullable=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # btree_gist lets the integer equality share a GiST index with the
+        # range overlap
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for column, constraint in BOOKINGS:
+            conflicts = op.get_bind().execute(sa.text('''
+                SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+                  ON a.{column} = b.{column} AND a.id < b.id
+                 AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time)
+                LIMIT 20
+            '''.format(column=column))).fetchall()
+            if conflicts:
+                raise RuntimeError('overlapping shows must be resolved before upgrading: {}'.format(
+                    ', '.join('{} and {}'.format(*pair) for pair in conflicts)))
+            op.execute('''
+                ALTER TABLE "Show" ADD CONSTRAINT "{constraint}"
+                EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)
+            '''.format(constraint=constraint, column=column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for _, constraint in reversed(BOOKINGS):
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT "{}"'.format(constraint))
+    op.drop_column('Show', 'end_time')
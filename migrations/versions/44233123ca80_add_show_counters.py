@@ -0,0 +1,48 @@
+"""add show counters
+
+Revision ID: 44233123ca80
+Revises: 5ac69adde777
+Create Date: 2026-10-18 11:20:54.118203
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '44233123ca80'
+down_revision = '5ac69adde777'
+branch_labels = None
+depends_on = None
+
+COUNTED = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    for table, foreign_key in COUNTED:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_time', sa.DateTime(), nullable=True))
+        op.create_index(op.f('ix_{}_next_show_time'.format(table)), table, ['next_show_time'], unique=False)
+
+        # show times are stored in the application's local time, so "now" is
+        # taken from Python rather than from the database clock
+        op.execute(sa.text('''
+            UPDATE "{table}" SET
+              upcoming_shows_count = (SELECT count(*) FROM "Show"
+                WHERE "Show".{fk} = "{table}".id AND "Show".start_time > :now),
+              past_shows_count = (SELECT count(*) FROM "Show"
+                WHERE "Show".{fk} = "{table}".id AND "Show".start_time <= :now),
+              next_show_time = (SELECT min("Show".start_time) FROM "Show"
+                WHERE "Show".{fk} = "{table}".id AND "Show".start_time > :now)
+        '''.format(table=table, fk=foreign_key)).bindparams(now=datetime.now()))
+
+
+def downgrade():
+    for table, _ in reversed(COUNTED):
+        op.drop_index(op.f('ix_{}_next_show_time'.format(table)), table_name=table)
+        op.drop_column(table, 'next_show_time')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
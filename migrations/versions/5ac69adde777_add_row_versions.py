@@ -0,0 +1,37 @@
+"""add row versions
+
+Revision ID: 5ac69adde777
+Revises: 8eb99c7a71c8
+Create Date: 2026-10-18 10:02:17.846315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5ac69adde777'
+down_revision = '8eb99c7a71c8'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite cannot add a column with a non-constant default
+        updated_at_default = sa.text("'1970-01-01 00:00:00'")
+    else:
+        updated_at_default = sa.func.now()
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=updated_at_default))
+        op.execute('UPDATE "{}" SET updated_at = CURRENT_TIMESTAMP'.format(table))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,48 @@
+"""add indexes for hot query paths
+
+Revision ID: 8eb99c7a71c8
+Revises: 03caaa8039f4
+Create Date: 2026-10-18 09:12:41.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8eb99c7a71c8'
+down_revision = '03caaa8039f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+
+    # name searches use ILIKE '%term%', which only a trigram index can serve;
+    # other databases get an index on the lowercased name instead
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    else:
+        op.create_index('ix_Venue_name_lower', 'Venue', [sa.text('lower(name)')], unique=False)
+        op.create_index('ix_Artist_name_lower', 'Artist', [sa.text('lower(name)')], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+        op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    else:
+        op.drop_index('ix_Artist_name_lower', table_name='Artist')
+        op.drop_index('ix_Venue_name_lower', table_name='Venue')
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
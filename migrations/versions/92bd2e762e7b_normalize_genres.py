@@ -0,0 +1,78 @@
+"""normalize genres
+
+Revision ID: 92bd2e762e7b
+Revises: 44233123ca80
+Create Date: 2026-10-18 12:41:08.357720
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92bd2e762e7b'
+down_revision = '44233123ca80'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+LINKS = (('Venue', 'venue_genres', 'venue_id'), ('Artist', 'artist_genres', 'artist_id'))
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, link, key in LINKS:
+        op.create_table(link,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id_{}'.format(link, key), link, ['genre_id', key], unique=False)
+
+    # The backfill walks the id range in batches. On PostgreSQL every batch
+    # commits on its own, so no lock is held for the whole table.
+    context = op.get_context()
+    if context.dialect.name == 'postgresql':
+        with context.autocommit_block():
+            backfill(op.get_bind())
+    else:
+        backfill(op.get_bind())
+
+
+def backfill(connection):
+    genres = {}
+    for table, link, key in LINKS:
+        last_id = 0
+        while True:
+            rows = connection.execute(sa.text(
+                'SELECT id, genres FROM "{}" WHERE id > :last_id ORDER BY id LIMIT :limit'.format(table)
+            ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+            links = []
+            for row in rows:
+                for name in {name for name in (row.genres or '').split(',') if name}:
+                    if name not in genres:
+                        connection.execute(sa.text('INSERT INTO "Genre" (name) VALUES (:name)'), {'name': name})
+                        genres[name] = connection.execute(sa.text(
+                            'SELECT id FROM "Genre" WHERE name = :name'), {'name': name}).scalar()
+                    links.append({'entity_id': row.id, 'genre_id': genres[name]})
+            if links:
+                connection.execute(sa.text(
+                    'INSERT INTO {} ({}, genre_id) VALUES (:entity_id, :genre_id)'.format(link, key)
+                ), links)
+            last_id = rows[-1].id
+
+
+def downgrade():
+    for _, link, key in reversed(LINKS):
+        op.drop_index('ix_{}_genre_id_{}'.format(link, key), table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
@@ -0,0 +1,31 @@
+"""add venue location
+
+Revision ID: afee20f59374
+Revises: 17ec9133919a
+Create Date: 2026-10-18 16:22:08.174305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'afee20f59374'
+down_revision = '17ec9133919a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing venues are placed afterwards with "flask geocode-venues"
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_Venue_geohash', 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geohash', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
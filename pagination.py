@@ -0,0 +1,69 @@
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+import base64
+import binascii
+from datetime import datetime
+
+
+def encode_cursor(value, row_id):
+    raw = '{}|{}'.format(value.isoformat(), row_id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Returns the ``(datetime, id)`` key encoded in cursor.
+
+    Raises ValueError for anything that was not produced by encode_cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError):
+        raise ValueError('malformed cursor')
+    value, _, row_id = raw.partition('|')
+    return datetime.fromisoformat(value), int(row_id)
+
+
+class KeysetPage(object):
+    """A page of rows ordered by a ``(datetime, id)`` key.
+
+    rows must hold up to ``per_page + 1`` rows in page order, or in reverse
+    order when paging backwards; the extra row only tells whether there is
+    another page in that direction. Forward pages are yielded as they are
+    read, so next_cursor is only known once the page has been iterated.
+    """
+
+    def __init__(self, rows, per_page, key, backwards=False, has_previous=False):
+        self._rows = rows
+        self.per_page = per_page
+        self.key = key
+        self.backwards = backwards
+        self.has_previous = has_previous
+        self.has_next = backwards
+        self._first = None
+        self._last = None
+
+    def __iter__(self):
+        rows = self._rows
+        if self.backwards:
+            rows = list(rows)
+            self.has_previous = len(rows) > self.per_page
+            rows = reversed(rows[:self.per_page])
+        for index, row in enumerate(rows):
+            if index == self.per_page:
+                self.has_next = True
+                break
+            if self._first is None:
+                self._first = row
+            self._last = row
+            yield row
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self._last is not None:
+            return encode_cursor(*self.key(self._last))
+
+    @property
+    def prev_cursor(self):
+        if self.has_previous and self._first is not None:
+            return encode_cursor(*self.key(self._first))
@@ -0,0 +1,93 @@
+#----------------------------------------------------------------------------#
+# SQL statement profiling.
+#----------------------------------------------------------------------------#
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(statement):
+    """Replaces literals and bound parameters with ``?`` and collapses lists
+    of them, so statements differing only in their values compare equal."""
+    statement = _LITERALS.sub('?', statement)
+    statement = _PLACEHOLDERS.sub('?', statement)
+    statement = _LISTS.sub('(?)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class StatementRecorder(object):
+    """Counts the SQL statements executed and the time spent in them.
+
+    With track_repeats, statements are also counted by their normalized
+    text, so one executed over and over (usually a lazy load inside a loop)
+    can be reported by repeated().
+    """
+
+    def __init__(self, track_repeats=False):
+        self.track_repeats = track_repeats
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if self.track_repeats:
+            self.statements[normalize_statement(statement)] += 1
+
+    def repeated(self, threshold):
+        """Returns ``(statement, count)`` pairs executed more than threshold times."""
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count > threshold]
+
+    def server_timing(self):
+        return 'db;desc="{} statements";dur={:.2f}'.format(self.count, self.seconds * 1000)
+
+
+@contextmanager
+def count_statements(engine=Engine):
+    """Yields a StatementRecorder of the statements run inside the block."""
+    recorder = StatementRecorder(track_repeats=True)
+
+    def start(conn, cursor, statement, parameters, context, executemany):
+        context.count_statements_started = time.perf_counter()
+
+    def stop(conn, cursor, statement, parameters, context, executemany):
+        recorder.record(statement, time.perf_counter() - context.count_statements_started)
+
+    event.listen(engine, 'before_cursor_execute', start)
+    event.listen(engine, 'after_cursor_execute', stop)
+    try:
+        yield recorder
+    finally:
+        event.remove(engine, 'before_cursor_execute', start)
+        event.remove(engine, 'after_cursor_execute', stop)
+
+
+@contextmanager
+def query_budget(max_statements, engine=Engine):
+    """Fails with AssertionError when the block runs more than max_statements.
+
+    Meant for tests, e.g.::
+
+        with query_budget(2):
+            client.get('/venues/1')
+    """
+    with count_statements(engine) as recorder:
+        yield recorder
+    if recorder.count > max_statements:
+        raise AssertionError('{} statements executed, the budget is {}:\n{}'.format(
+            recorder.count, max_statements,
+            '\n'.join('{:>4} x {}'.format(count, statement)
+                      for statement, count in recorder.statements.most_common())))
@@ -0,0 +1,117 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+import logging
+import random
+import threading
+import time
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a replica is behind its primary. A standby that has replayed all
+# the WAL it received is up to date even when the primary has been idle.
+LAG_QUERIES = {
+    'postgresql': """
+        SELECT CASE
+          WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+          ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """,
+}
+
+
+class ReplicaSet(object):
+    """Replica engines, of which only those within max_lag seconds of the
+    primary are used.
+
+    The replicas are checked at most every check_interval seconds, by
+    whichever request asks for one once the interval is over.
+    """
+
+    def __init__(self, engines, max_lag, check_interval):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy = list(engines)
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """Returns a healthy replica engine, or None to use the primary."""
+        if not self.engines:
+            return None
+        if time.time() - self.checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self.check()
+            finally:
+                self._lock.release()
+        healthy = self.healthy
+        return random.choice(healthy) if healthy else None
+
+    def check(self):
+        healthy = []
+        for engine in self.engines:
+            try:
+                with engine.connect() as connection:
+                    lag = connection.execute(text(LAG_QUERIES.get(engine.dialect.name, 'SELECT 0'))).scalar()
+            except SQLAlchemyError as error:
+                lag, reason = None, str(error)
+            else:
+                reason = 'lagging {:.1f} s behind'.format(lag or 0)
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(engine)
+                if engine not in self.healthy:
+                    logger.warning('replica %s is back in use', engine.url)
+            elif engine in self.healthy:
+                logger.warning('replica %s taken out of use: %s', engine.url, reason)
+        self.healthy = healthy
+        self.checked_at = time.time()
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from a replica when the request allows it.
+
+    Requests opt in by setting ``g.use_replica``. Flushes, and every
+    statement after the session wrote something, go to the primary. The
+    replica is chosen once and kept until the session is closed, so all the
+    reads of a request see the same replay point.
+    """
+
+    _unset = object()
+
+    def __init__(self, db, **options):
+        self.replicas = db.replicas
+        self.wrote = False
+        self.replica = self._unset
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not (self._flushing or self.wrote) and has_request_context() and g.get('use_replica'):
+            if self.replica is self._unset:
+                self.replica = self.replicas.choose()
+            if self.replica is not None:
+                return self.replica
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def close(self):
+        self.replica = self._unset
+        super(RoutingSession, self).close()
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            self.wrote = True
+        super(RoutingSession, self).flush(objects)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose sessions route reads to the replicas in self.replicas."""
+
+    replicas = ReplicaSet([], max_lag=0, check_interval=0)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
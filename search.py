@@ -0,0 +1,129 @@
+#----------------------------------------------------------------------------#
+# In-memory name search.
+#----------------------------------------------------------------------------#
+import threading
+import time
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex(object):
+    """Trigram index over the text fields of venues or artists.
+
+    Matching is a case-insensitive substring test, the same as
+    ``ilike('%term%')``; the trigram postings only narrow down which
+    documents have to be tested. Terms shorter than three characters fall
+    back to single character postings.
+
+    A rebuild fills a new index while searches keep using the current one,
+    which is swapped out only once the new one is complete.
+    """
+
+    def __init__(self, fields=('name',)):
+        self.fields = fields
+        self.built_at = None
+        self._documents = {}
+        self._postings = {}
+        # add() and remove() calls made during a rebuild, replayed on the
+        # new index before it replaces the current one
+        self._changes = None
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __getitem__(self, doc_id):
+        return self._documents[doc_id]
+
+    def _grams_for(self, doc):
+        grams = set()
+        for field in self.fields:
+            text = (doc.get(field) or '').lower()
+            grams.update((field, gram) for gram in _grams(text, 1))
+            grams.update((field, gram) for gram in _grams(text, 3))
+        return grams
+
+    def rebuild(self, documents):
+        """Replaces the whole index with ``(doc_id, fields)`` pairs.
+
+        Returns False without reading documents when another rebuild is
+        already running.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                self._changes = []
+            new = SearchIndex(self.fields)
+            for doc_id, doc in documents:
+                new._add(doc_id, doc)
+            with self._lock:
+                for change, args in self._changes:
+                    getattr(new, change)(*args)
+                self._documents, self._postings = new._documents, new._postings
+                self.built_at = time.time()
+            return True
+        finally:
+            with self._lock:
+                self._changes = None
+            self._rebuild_lock.release()
+
+    def add(self, doc_id, doc):
+        """Adds a document, replacing any previous version of it."""
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(('_add', (doc_id, dict(doc))))
+            self._add(doc_id, doc)
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(('_remove', (doc_id,)))
+            self._remove(doc_id)
+
+    def _add(self, doc_id, doc):
+        self._remove(doc_id)
+        doc = dict(doc)
+        self._documents[doc_id] = doc
+        for key in self._grams_for(doc):
+            self._postings.setdefault(key, set()).add(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._documents.pop(doc_id, None)
+        if doc is None:
+            return
+        for key in self._grams_for(doc):
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[key]
+
+    def search(self, term, field='name'):
+        """Returns the ids of documents whose field contains term.
+
+        Results are ranked by where the match starts (prefix matches first),
+        then by the length of the field and finally alphabetically.
+        """
+        term = term.lower()
+        with self._lock:
+            if not term:
+                candidates = set(self._documents)
+            else:
+                grams = _grams(term, 3) or _grams(term, 1)
+                postings = sorted(
+                    (self._postings.get((field, gram), set()) for gram in grams),
+                    key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+
+            matches = []
+            for doc_id in candidates:
+                text = (self._documents[doc_id].get(field) or '').lower()
+                position = text.find(term)
+                if position != -1:
+                    matches.append((position, len(text), text, doc_id))
+        matches.sort()
+        return [doc_id for _, _, _, doc_id in matches]
@@ -0,0 +1,65 @@
+"""Fixtures running the app against a SQLite database seeded once per test
+session: five venues in two areas, four artists and forty shows, half of
+them past, so every venue and artist page lists several shows."""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE = os.path.join(tempfile.mkdtemp(prefix='fyyur-tests-'), 'fyyur.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ['PURGE_IN_BACKGROUND'] = '0'
+
+VENUES = [
+    ('The Musical Hop', 'San Francisco', 'CA'),
+    ('Park Square Live Music & Coffee', 'San Francisco', 'CA'),
+    ('The Dueling Pianos Bar', 'San Francisco', 'CA'),
+    ('The Blue Note', 'New York', 'NY'),
+    ('Village Vanguard', 'New York', 'NY'),
+]
+ARTISTS = ['Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band', 'Hot Club Trio']
+SHOWS = 40
+
+
+@pytest.fixture(scope='session')
+def fyyur():
+    """The app module, with its tables created and seeded."""
+    import app as fyyur
+
+    fyyur.app.config.update(WTF_CSRF_ENABLED=False, SQL_PROFILE_SAMPLE_RATE=0.0)
+    with fyyur.app.app_context():
+        fyyur.db.create_all()
+        venues = [fyyur.Venue(name=name, city=city, state=state, address='{} Main Street'.format(index),
+                              genres='Jazz,Folk', website_link='https://venue.example.com',
+                              facebook_link='https://www.facebook.com/venue')
+                  for index, (name, city, state) in enumerate(VENUES, 1)]
+        artists = [fyyur.Artist(name=name, city='San Francisco', state='CA', genres='Jazz',
+                                phone='555-555-5555', website_link='https://artist.example.com')
+                   for name in ARTISTS]
+        fyyur.db.session.add_all(venues + artists)
+        fyyur.db.session.flush()
+        now = datetime.now().replace(microsecond=0)
+        for index in range(SHOWS):
+            start_time = now + timedelta(days=(index // 2 + 1) * (1 if index % 2 else -1))
+            fyyur.db.session.add(fyyur.Show(venue_id=venues[index % len(venues)].id,
+                                            artist_id=artists[index % len(artists)].id,
+                                            start_time=start_time, end_time=start_time + timedelta(hours=2)))
+        fyyur.db.session.commit()
+    # the first request builds the search indexes; the tests count the
+    # statements of the requests after it
+    assert fyyur.app.test_client().get('/').status_code == 200
+    yield fyyur
+    os.remove(DATABASE)
+
+
+@pytest.fixture
+def client(fyyur):
+    """A test client whose requests start with empty caches."""
+    fyyur.page_cache.clear()
+    fyyur.fragment_cache.clear()
+    return fyyur.app.test_client()
+
@@ -0,0 +1,32 @@
+"""Overlap checks of shows saved through the ORM."""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def new_show(fyyur, venue_id, artist_id, start_time):
+    return fyyur.Show(venue_id=venue_id, artist_id=artist_id,
+                      start_time=start_time, end_time=start_time + timedelta(hours=2))
+
+
+@pytest.mark.parametrize('venue_ids, artist_ids', [((1, 1), (1, 2)), ((1, 2), (3, 3))])
+def test_shows_saved_together_are_checked_against_each_other(fyyur, venue_ids, artist_ids):
+    start_time = datetime(2090, 1, 1, 20)
+    with fyyur.app.app_context():
+        fyyur.db.session.add_all([new_show(fyyur, venue_id, artist_id, start_time + timedelta(hours=index))
+                                  for index, (venue_id, artist_id) in enumerate(zip(venue_ids, artist_ids))])
+        with pytest.raises(fyyur.BookingError, match='a show saved with this one'):
+            fyyur.db.session.commit()
+        fyyur.db.session.rollback()
+        assert fyyur.Show.query.filter(fyyur.Show.start_time >= start_time).count() == 0
+
+
+def test_shows_saved_together_may_follow_each_other(fyyur):
+    start_time = datetime(2090, 1, 1, 20)
+    with fyyur.app.app_context():
+        shows = [new_show(fyyur, 1, 1, start_time), new_show(fyyur, 1, 1, start_time + timedelta(hours=2))]
+        fyyur.db.session.add_all(shows)
+        fyyur.db.session.commit()
+        for show in shows:
+            fyyur.db.session.delete(show)
+        fyyur.db.session.commit()
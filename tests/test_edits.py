@@ -0,0 +1,64 @@
+"""Edits through the JSON API, and the pages they change."""
+import pytest
+
+
+def etags(client, urls):
+    return {url: client.get(url).headers['ETag'] for url in urls}
+
+
+def patch_venue(fyyur, client, venue_id, **fields):
+    with fyyur.app.app_context():
+        version = fyyur.db.session.get(fyyur.Venue, venue_id).version
+    return client.patch('/api/v1/venues/{}'.format(venue_id), json=dict(fields, version=version))
+
+
+@pytest.fixture
+def renamed_venue(fyyur, client):
+    # venue 1 has upcoming shows of artists 2 and 4, and only past shows of
+    # artists 1 and 3
+    yield lambda name: patch_venue(fyyur, client, 1, name=name)
+    assert patch_venue(fyyur, client, 1, name='The Musical Hop').status_code == 200
+
+
+ARTIST_PAGES = ['/artists/1', '/artists/2', '/artists/3', '/artists/4']
+
+
+def test_rename_changes_every_linked_page(client, renamed_venue):
+    before = etags(client, ARTIST_PAGES)
+    assert renamed_venue('The Musical Skip').status_code == 200
+    after = etags(client, ARTIST_PAGES)
+    assert all(after[url] != before[url] for url in ARTIST_PAGES)
+    assert b'The Musical Skip' in client.get('/artists/1').data
+
+
+def test_rename_queues_the_linked_pages_past_a_batch(fyyur, client, renamed_venue, monkeypatch):
+    queued = []
+    monkeypatch.setitem(fyyur.app.config, 'LINKED_PAGES_BATCH_SIZE', 1)
+    monkeypatch.setattr(fyyur, 'start_linked_touch', lambda *args: queued.append(args))
+    before = etags(client, ARTIST_PAGES)
+    assert renamed_venue('The Musical Skip').status_code == 200
+    assert len(queued) == 1
+    # one page is touched by the edit, the latest shows first
+    assert [url for url in ARTIST_PAGES if client.get(url).headers['ETag'] != before[url]] == ['/artists/4']
+    with fyyur.app.app_context():
+        fyyur.touch_remaining_linked_pages(*queued[0])
+    after = etags(client, ARTIST_PAGES)
+    assert all(after[url] != before[url] for url in ARTIST_PAGES)
+
+
+@pytest.mark.parametrize('fields', [
+    {'name': 5},
+    {'name': {'first': 'The'}},
+    {'city': ['a']},
+    {'seeking_talent': 'no'},
+    {'genres': 'Jazz'},
+    {'genres': ['Jazz', 1]},
+])
+def test_update_rejects_values_of_the_wrong_type(fyyur, client, fields):
+    with fyyur.app.app_context():
+        version = fyyur.db.session.get(fyyur.Venue, 2).version
+    response = patch_venue(fyyur, client, 2, **fields)
+    assert response.status_code == 400
+    assert list(response.get_json()['fields']) == list(fields)
+    with fyyur.app.app_context():
+        assert fyyur.db.session.get(fyyur.Venue, 2).version == version
@@ -0,0 +1,93 @@
+"""Statements run, and ORM entities loaded, by each page and API route.
+
+The detail pages load their shows with one SELECT per relationship; forms,
+listings and searches load no shows at all. A change in any of these counts
+is a change in how a route reads the database.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from profiling import count_statements
+
+# (method, url, statements, entities loaded by class name), with the caches
+# empty and against the data seeded by conftest.py
+ROUTES = [
+    ('GET', '/venues', 3, {}),
+    ('GET', '/venues/1', 3, {'Venue': 1, 'Show': 8, 'Artist': 4}),
+    ('GET', '/venues/1/edit', 1, {'Venue': 1}),
+    ('POST', '/venues/search', 1, {}),
+    ('GET', '/venues/nearby?lat=37.77&lon=-122.42', 4, {}),
+    ('GET', '/venues/1/shows.ics', 3, {}),
+    ('GET', '/venues/create', 0, {}),
+    ('GET', '/artists', 3, {}),
+    ('GET', '/artists/1', 3, {'Artist': 1, 'Show': 10, 'Venue': 5}),
+    ('GET', '/artists/1/edit', 1, {'Artist': 1}),
+    ('POST', '/artists/search', 1, {}),
+    ('GET', '/artists/1/shows.ics', 3, {}),
+    ('GET', '/shows', 1, {}),
+    ('GET', '/shows/create', 0, {}),
+    ('GET', '/api/v1/venues', 2, {}),
+    ('GET', '/api/v1/venues/1', 2, {'Venue': 1, 'Show': 8, 'Artist': 4}),
+    ('GET', '/api/v1/artists', 2, {}),
+    ('GET', '/api/v1/artists/1', 2, {'Artist': 1, 'Show': 10, 'Venue': 5}),
+    ('GET', '/api/v1/shows', 1, {}),
+]
+
+
+@contextmanager
+def loaded_entities(model):
+    """Yields a dict counting, by class name, the instances loaded from rows
+    while the block runs."""
+    loaded = {}
+
+    def count(entity, context):
+        name = type(entity).__name__
+        loaded[name] = loaded.get(name, 0) + 1
+
+    event.listen(model, 'load', count, propagate=True)
+    try:
+        yield loaded
+    finally:
+        event.remove(model, 'load', count)
+
+
+@pytest.mark.parametrize('method, url, statements, entities', ROUTES,
+                         ids=['{} {}'.format(method, url) for method, url, _, _ in ROUTES])
+def test_route_reads(fyyur, client, method, url, statements, entities):
+    with count_statements() as recorder, loaded_entities(fyyur.db.Model) as loaded:
+        response = client.open(url, method=method, data={'search_term': 'a'})
+        # streamed bodies run their queries while they are read
+        response.get_data()
+        response.close()
+    assert response.status_code == 200
+    assert recorder.count == statements, recorder.statements
+    assert loaded == entities
+
+
+def test_cached_detail_pages_skip_the_shows(fyyur, client):
+    client.get('/venues/1')
+    with count_statements() as recorder, loaded_entities(fyyur.db.Model) as loaded:
+        assert client.get('/venues/1').status_code == 200
+    # only the validators are read once the page data is cached
+    assert recorder.count == 1
+    assert loaded == {}
+
+
+def test_cached_detail_pages_follow_the_validators(fyyur, client):
+    # a row changed behind the cache's back, as by another worker, gets a
+    # new ETag and the body that goes with it
+    venues = fyyur.Venue.__table__
+    assert b'Village Vanguard' in client.get('/venues/5').data
+    with fyyur.app.app_context():
+        fyyur.db.session.execute(venues.update().where(venues.c.id == 5)
+                                 .values(name='The Vanguard', version=venues.c.version + 1))
+        fyyur.db.session.commit()
+    try:
+        assert b'The Vanguard' in client.get('/venues/5').data
+    finally:
+        with fyyur.app.app_context():
+            fyyur.db.session.execute(venues.update().where(venues.c.id == 5)
+                                     .values(name='Village Vanguard', version=venues.c.version + 1))
+            fyyur.db.session.commit()
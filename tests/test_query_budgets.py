@@ -0,0 +1,47 @@
+"""Query budgets of the main routes.
+
+Every venue and artist in the seeded data has eight or more shows, so a
+statement run once per show or per venue (an N+1 query) takes a route well
+past its budget and fails the build.
+"""
+import pytest
+
+from profiling import query_budget
+
+BUDGETS = {
+    '/venues': 3,
+    '/venues/1': 3,
+    '/venues/1/edit': 1,
+    '/artists': 3,
+    '/artists/1': 3,
+    '/artists/1/edit': 1,
+    '/shows': 1,
+    '/venues/1/shows.ics': 3,
+    '/artists/1/shows.ics': 3,
+    '/api/v1/venues/1': 2,
+    '/api/v1/artists/1': 2,
+    '/api/v1/shows': 1,
+}
+
+
+@pytest.mark.parametrize('url, budget', sorted(BUDGETS.items()))
+def test_route_stays_within_budget(client, url, budget):
+    with query_budget(budget):
+        response = client.get(url)
+        response.get_data()
+        response.close()
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/venues/search', '/artists/search'])
+def test_search_stays_within_budget(client, url):
+    # the counters of every match are read in one statement
+    with query_budget(1):
+        assert client.post(url, data={'search_term': 'a'}).status_code == 200
+
+
+def test_budget_catches_a_statement_per_show(fyyur):
+    with pytest.raises(AssertionError, match='the budget is 2'):
+        with query_budget(2), fyyur.app.app_context():
+            for show in fyyur.Show.query.limit(5):
+                show.venue.name